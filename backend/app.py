@@ -1,26 +1,34 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, Response, request, jsonify, render_template, send_file, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import os
-import tempfile
 import json
+import base64
+import threading
+import time
+import uuid
+import multiprocessing
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 import numpy as np
 from PIL import Image
-import io
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle, HRFlowable
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from urllib.parse import urlencode
+
+from database import configure_database, increment_counters, lock_for_rewrite
+from derivatives import DERIVATIVE_VERSION, VARIANTS, ensure_derivative
+from model_config import PREDICTION_CACHE_CONFIG
+from prediction_cache import PredictionCache, prediction_key
+from preprocessing import open_for_inference
+from reports import render_report, report_path
+from storage import store_upload
 
 app = Flask(__name__)
-CORS(app, origins=['https://sighttech.mx', 'https://www.sighttech.mx', 'http://localhost:8080', 'http://localhost:5001', 'http://localhost:3000'])
+CORS(app, origins=['https://sighttech.mx', 'https://www.sighttech.mx', 'http://localhost:8080', 'http://localhost:5001', 'http://localhost:3000'],
+     expose_headers=['X-Next-Cursor', 'Link'])
 
-# Configuración de la base de datos
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sighttech.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Configuración de la base de datos (DATABASE_URL o SQLite con WAL; ver database.py)
+configure_database(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sighttech-secret-key-dev')
 
 db = SQLAlchemy(app)
@@ -44,21 +52,283 @@ class Patient(db.Model):
     comorbidities = db.Column(db.Text)
     last_eye_exam = db.Column(db.String(50))
     previous_diagnosis = db.Column(db.String(100))
+    # Clave natural para reconocer al paciente en visitas posteriores
+    name_key = db.Column(db.String(100))  # Nombre normalizado (minúsculas, espacios simples)
+    birth_year = db.Column(db.Integer)
+    clinic = db.Column(db.String(100), default='')
+    external_id = db.Column(db.String(100))  # Expediente del paciente en su clínica (si se informa)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     diagnoses = db.relationship('Diagnosis', backref='patient', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_patient_created_at_id', 'created_at', 'id'),  # Listado por fecha de alta
+        db.Index('ix_patient_natural_key', 'name_key', 'birth_year', 'clinic'),
+        db.Index('ix_patient_external_id', 'external_id', 'clinic'),
+    )
+
 class Diagnosis(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     image_paths = db.Column(db.Text)  # JSON array de rutas de imágenes
     prediction = db.Column(db.String(100))
-    confidence = db.Column(db.Float)
-    severity = db.Column(db.Integer)
+    # active_history: al modificarlos, el flush conoce el valor anterior (contadores del dashboard)
+    confidence = db.column_property(db.Column(db.Float), active_history=True)
+    severity = db.column_property(db.Column(db.Integer), active_history=True)
     recommendations = db.Column(db.Text)
     symptoms = db.Column(db.Text)  # JSON de síntomas
     medical_history = db.Column(db.Text)  # JSON de historial médico
     pdf_path = db.Column(db.String(500))  # Ruta al archivo PDF generado
+    physician_name = db.Column(db.String(100))  # Médico que firma el reporte
+    # JSON con los datos clínicos del paciente tal como se informaron en esta visita
+    patient_snapshot = db.Column(db.Text)
+    # True cuando síntomas, factores de riesgo, recomendaciones e imágenes ya están en sus tablas
+    details_indexed = db.Column(db.Boolean, default=False)
+    created_at = db.column_property(db.Column(db.DateTime, default=datetime.utcnow), active_history=True)
+
+    __table_args__ = (
+        # Diagnósticos de hoy (rango) y recientes (ORDER BY created_at DESC)
+        db.Index('ix_diagnosis_created_at', 'created_at'),
+        # Dashboard: GROUP BY severity y AVG(confidence) solo con el índice
+        db.Index('ix_diagnosis_severity_confidence', 'severity', 'confidence'),
+        # Historial de un paciente; también cubre las búsquedas por patient_id
+        db.Index('ix_diagnosis_patient_created', 'patient_id', 'created_at'),
+        # Índice parcial: solo las filas que aún faltan por normalizar (casi siempre vacío)
+        db.Index('ix_diagnosis_details_pending', 'id',
+                 sqlite_where=db.text('details_indexed = 0'),
+                 postgresql_where=db.text('details_indexed = false')),
+    )
+
+# Versión normalizada (consultable en la BD) de los JSON de Diagnosis; el JSON se conserva
+# tal cual para el reporte y /api/diagnosis/<id>
+class DiagnosisSymptom(db.Model):
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnosis.id'), primary_key=True)
+    symptom = db.Column(db.String(50), primary_key=True)  # p. ej. 'perdida_vision'
+
+    __table_args__ = (db.Index('ix_diagnosis_symptom_symptom', 'symptom', 'diagnosis_id'),)
+
+class DiagnosisRiskFactor(db.Model):
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnosis.id'), primary_key=True)
+    factor = db.Column(db.String(50), primary_key=True)  # p. ej. 'tabaquismo'
+
+    __table_args__ = (db.Index('ix_diagnosis_risk_factor_factor', 'factor', 'diagnosis_id'),)
+
+class DiagnosisRecommendation(db.Model):
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnosis.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.Text, nullable=False)
+
+class DiagnosisImage(db.Model):
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnosis.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), nullable=False)
+
+    __table_args__ = (db.Index('ix_diagnosis_image_path', 'path'),)  # ¿Qué diagnósticos usan esta imagen?
+
+class AnalysisJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    stage = db.Column(db.String(20))  # Última etapa completada del pipeline
+    inputs = db.Column(db.Text)  # JSON con rutas de imágenes y datos del formulario
+    result = db.Column(db.Text)  # JSON con resultados parciales o la respuesta final
+    error = db.Column(db.Text)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnosis.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DashboardStat(db.Model):
+    """Contadores del dashboard mantenidos en la misma transacción que cada alta
+
+    Claves: 'patients', 'diagnoses', 'confidence' (count = no nulos, total = suma),
+    'severity:<n>' y 'day:<YYYY-MM-DD>' (fecha UTC de created_at).
+    """
+    key = db.Column(db.String(40), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+_DIAGNOSIS_STAT_FIELDS = ('severity', 'confidence', 'created_at')
+
+def diagnosis_stats(severity, confidence, created_at):
+    """Aporte de un diagnóstico a los contadores (sin 'diagnoses'): [(clave, count, total)]"""
+    stats = [(f'severity:{severity}', 1, 0.0)]
+    if confidence is not None:
+        stats.append(('confidence', 1, confidence))
+    if created_at is not None:
+        stats.append((f'day:{created_at.date().isoformat()}', 1, 0.0))
+    return stats
+
+def _previous_values(obj):
+    """Valores de _DIAGNOSIS_STAT_FIELDS antes de este flush (los que ya cuentan los contadores)"""
+    state = db.inspect(obj)
+    values = []
+    for name in _DIAGNOSIS_STAT_FIELDS:
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if history.deleted else getattr(obj, name))
+    return values
+
+def _stat_deltas(session):
+    deltas = {}
+
+    def add(key, count=1, total=0.0):
+        old_count, old_total = deltas.get(key, (0, 0.0))
+        deltas[key] = (old_count + count, old_total + total)
+
+    def add_diagnosis(values, sign):
+        for key, count, total in diagnosis_stats(*values):
+            add(key, sign * count, sign * total)
+
+    for obj in session.new:
+        if isinstance(obj, Patient):
+            add('patients')
+        elif isinstance(obj, Diagnosis):
+            add('diagnoses')
+            add_diagnosis([getattr(obj, name) for name in _DIAGNOSIS_STAT_FIELDS], 1)
+    for obj in session.deleted:
+        if isinstance(obj, Patient):
+            add('patients', -1)
+        elif isinstance(obj, Diagnosis):
+            add('diagnoses', -1)
+            add_diagnosis(_previous_values(obj), -1)
+    # Modificaciones: restar el aporte anterior y sumar el nuevo (p. ej. cambio de severidad)
+    for obj in session.dirty:
+        if isinstance(obj, Diagnosis) and obj not in session.deleted:
+            previous = _previous_values(obj)
+            current = [getattr(obj, name) for name in _DIAGNOSIS_STAT_FIELDS]
+            if previous != current:
+                add_diagnosis(previous, -1)
+                add_diagnosis(current, 1)
+    return {key: delta for key, delta in deltas.items() if delta != (0, 0.0)}
+
+@db.event.listens_for(db.session, 'after_flush')
+def _update_dashboard_stats(session, flush_context):
+    """Aplica a dashboard_stat las altas, bajas y modificaciones de este flush, en su misma transacción"""
+    increment_counters(session.connection(), DashboardStat.__table__, _stat_deltas(session))
+
+def reconcile_stats():
+    """Reconstruye dashboard_stat desde cero con agregados sobre las tablas (tras cargas masivas
+    con Core, que no pasan por la sesión, o si se sospecha deriva)"""
+    started = datetime.now()
+    # Lecturas y reescritura en una sola transacción de escritura: ningún alta se confirma entre
+    # ambas (su incremento se perdería al borrar los contadores)
+    lock_for_rewrite(db.session.connection(), DashboardStat.__table__)
+    deltas = {'patients': (Patient.query.count(), 0.0), 'diagnoses': (Diagnosis.query.count(), 0.0)}
+    conf_count, conf_sum = db.session.query(
+        db.func.count(Diagnosis.confidence), db.func.coalesce(db.func.sum(Diagnosis.confidence), 0.0)
+    ).one()
+    deltas['confidence'] = (conf_count, float(conf_sum))
+    for severity, count in db.session.query(Diagnosis.severity, db.func.count(Diagnosis.id)) \
+            .group_by(Diagnosis.severity):
+        deltas[f'severity:{severity}'] = (count, 0.0)
+    day = db.func.date(Diagnosis.created_at)
+    for value, count in db.session.query(day, db.func.count(Diagnosis.id)) \
+            .filter(Diagnosis.created_at.isnot(None)).group_by(day):
+        deltas[f'day:{value}'] = (count, 0.0)
+
+    DashboardStat.query.delete()
+    increment_counters(db.session.connection(), DashboardStat.__table__, deltas)
+    db.session.commit()
+    print(f"📊 Estadísticas del dashboard reconstruidas ({len(deltas)} claves) en "
+          f"{(datetime.now() - started).total_seconds():.2f}s")
+    return len(deltas)
+
+def _start_stats_reconciler():
+    """Reconciliación periódica opcional (STATS_RECONCILE_HOURS, 0 = desactivada)"""
+    hours = float(os.environ.get('STATS_RECONCILE_HOURS', 24))
+    if hours <= 0:
+        return None
+
+    def _run():
+        while True:
+            time.sleep(hours * 3600)
+            with app.app_context():
+                try:
+                    reconcile_stats()
+                except Exception as e:
+                    print(f"⚠️ Error reconciliando estadísticas: {e}")
+                    db.session.rollback()
+
+    thread = threading.Thread(target=_run, name='stats-reconciler', daemon=True)
+    thread.start()
+    return thread
+
+# Pool de hilos para los trabajos de /api/analyze?async=1
+_analysis_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ANALYSIS_WORKERS', 2)),
+    thread_name_prefix='analysis-job'
+)
+
+# Pool acotado para almacenar y decodificar en paralelo las imágenes de una visita
+# (Pillow libera el GIL al decodificar)
+_upload_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('UPLOAD_WORKERS', 4)),
+    thread_name_prefix='upload'
+)
+
+# Pool para renderizar reportes PDF fuera de la petición de análisis
+_report_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('REPORT_WORKERS', 1)),
+    thread_name_prefix='pdf-report'
+)
+
+# Pool de procesos para renderizar los PDF faltantes de /api/export/reports (se crea al primer uso)
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', min(4, os.cpu_count() or 1)))
+_export_pool = None
+_export_pool_lock = threading.Lock()
+
+def _get_export_pool():
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is None:
+            # spawn: no heredar los hilos ni el modelo del proceso web
+            _export_pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _export_pool
+
+# Estado del precalentamiento del modelo (consultado por /api/ready)
+_model_warmup = {'status': 'pending', 'error': None, 'seconds': None}
+
+# Aceptar tráfico aunque el modelo no cargue (predicciones simuladas); solo para demos
+READY_WITHOUT_MODEL = os.environ.get('READY_WITHOUT_MODEL', '0') == '1'
+
+def start_model_warmup():
+    """Carga y calienta el modelo en segundo plano para no bloquear el arranque"""
+    def _run():
+        started = datetime.now()
+        _model_warmup['status'] = 'warming'
+        try:
+            from real_ai_model import warmup_model
+            warmup_model()
+            _model_warmup['status'] = 'ready'
+        except Exception as e:
+            # Sin modelo real la app respondería con simulación: /api/ready devuelve 503
+            # (salvo READY_WITHOUT_MODEL=1)
+            print(f"⚠️ No se pudo precalentar el modelo: {e}")
+            _model_warmup['status'] = 'failed'
+            _model_warmup['error'] = str(e)
+        _model_warmup['seconds'] = round((datetime.now() - started).total_seconds(), 2)
+
+    thread = threading.Thread(target=_run, name='model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_CONFIG['max_entries'],
+    persist_dir=PREDICTION_CACHE_CONFIG['persist_dir']
+)
+
+def _prediction_cache_key(images):
+    """Clave de caché para las imágenes con el modelo activo (None si no aplica)"""
+    if not PREDICTION_CACHE_CONFIG['enabled']:
+        return None
+    try:
+        # Id de los pesos cargados (recarga el modelo si el archivo cambió), no solo del archivo
+        from real_ai_model import current_model_id
+        model_id = current_model_id()
+    except Exception:
+        return None
+    if model_id is None:
+        return None
+    prediction_cache.ensure_model(model_id)
+    return prediction_key(images, model_id)
 
 def predict_retinopathy(images, filenames=None):
     """Función que predice retinopatía diabética usando IA"""
@@ -66,12 +336,24 @@ def predict_retinopathy(images, filenames=None):
     demo_key = _demo_key_from_filenames(filenames)
     if demo_key:
         return predict_with_simulation(images, filenames=filenames)
+
+    cache_key = _prediction_cache_key(images)
+    if cache_key:
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            print("⚡ Predicción recuperada de caché")
+            return cached
+
     try:
-        return predict_with_real_model(images)
+        result = predict_with_real_model(images)
     except Exception as e:
         print(f"⚠️ Modelo real no disponible, usando simulación: {e}")
         return predict_with_simulation(images, filenames=filenames)
 
+    if cache_key:
+        prediction_cache.put(cache_key, result)
+    return result
+
 def predict_with_real_model(images):
     """Predicción usando modelo real de IA"""
     try:
@@ -414,223 +696,353 @@ def generate_recommendations(prediction, confidence, symptoms_data=None, medical
     
     return recommendations
 
-def create_pdf_report(patient_data, images, diagnosis_result, physician_name='SightTech'):
-    """Crea un reporte PDF médico profesional con jerarquía visual clara"""
+@app.route('/')
+def index():
+    return render_template('dashboard.html')
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        pdf_path = tmp_file.name
+_PATIENT_REPORT_FIELDS = (
+    'name', 'age', 'gender', 'diabetes_years', 'diabetes_type', 'glucose_level', 'hba1c',
+    'blood_pressure', 'cholesterol', 'bmi', 'vision_right_eye', 'vision_left_eye',
+    'medications', 'comorbidities', 'last_eye_exam', 'previous_diagnosis'
+)
+
+def visit_patient_data(diagnosis):
+    """Datos del paciente registrados en esa visita; los diagnósticos anteriores a
+    patient_snapshot usan la ficha del paciente"""
+    snapshot = _json_or_none(diagnosis.patient_snapshot)
+    if isinstance(snapshot, dict):
+        return {f: snapshot.get(f) for f in _PATIENT_REPORT_FIELDS}
+    return {f: getattr(diagnosis.patient, f) for f in _PATIENT_REPORT_FIELDS}
+
+def _report_inputs(diagnosis):
+    """Argumentos de render_report para un diagnóstico (datos planos, serializables)"""
+    return {
+        'patient_data': visit_patient_data(diagnosis),
+        # Rutas: el reporte usa el derivado a resolución de impresión de cada imagen (omite las
+        # que ya no existen, pero las cuenta en "Imágenes analizadas")
+        'images': json.loads(diagnosis.image_paths or '[]'),
+        'diagnosis_result': {
+            'prediction': diagnosis.prediction,
+            'confidence': diagnosis.confidence or 0,
+            'severity': diagnosis.severity or 1,
+            'recommendations': json.loads(diagnosis.recommendations or '[]'),
+        },
+        'physician_name': diagnosis.physician_name or 'SightTech',
+        # created_at se guarda en UTC sin zona; el reporte muestra la hora local
+        'report_date': (diagnosis.created_at.replace(tzinfo=timezone.utc).astimezone()
+                        if diagnosis.created_at else None),
+    }
 
-    doc = SimpleDocTemplate(
-        pdf_path, pagesize=A4,
-        leftMargin=0.75*inch, rightMargin=0.75*inch,
-        topMargin=0.55*inch, bottomMargin=0.75*inch
-    )
-    story = []
-    styles = getSampleStyleSheet()
-
-    severity   = diagnosis_result.get('severity', 1)
-    confidence = diagnosis_result.get('confidence', 0)
-    prediction = diagnosis_result.get('prediction', '—')
-
-    SEV_COLORS  = {1:'#10b981', 2:'#3b82f6', 3:'#f59e0b', 4:'#ef4444', 5:'#dc2626'}
-    SEV_LABELS  = ['Sin RD', 'Leve', 'Moderada', 'Severa', 'Proliferativa']
-    NEXT_REVIEW = {1:'6-12 meses', 2:'3-6 meses', 3:'1-2 meses', 4:'2-4 semanas', 5:'1-2 semanas'}
-    PROG_RISK   = ['Bajo', 'Moderado', 'Alto', 'Muy alto', 'Crítico']
-    URGENCY     = {4:'Consulta URGENTE (24-48h)', 5:'Consulta URGENTE (24-48h)'}
-
-    sev_color = colors.HexColor(SEV_COLORS.get(severity, '#10b981'))
-    sev_label = SEV_LABELS[severity-1] if 1 <= severity <= 5 else '—'
-    accent    = colors.HexColor('#0ea5e9')
-
-    def ps(name, **kw):
-        return ParagraphStyle(name, parent=styles['Normal'], **kw)
-
-    white_big   = ps('WBig',  fontSize=20, fontName='Helvetica-Bold', textColor=colors.white, alignment=TA_CENTER)
-    white_med   = ps('WMed',  fontSize=9,  textColor=colors.white, alignment=TA_CENTER)
-    white_sm    = ps('WSm',   fontSize=7.5,textColor=colors.HexColor('#e5e7eb'), alignment=TA_CENTER)
-    sec_title   = ps('SecT',  fontSize=8,  fontName='Helvetica-Bold', textColor=accent, spaceBefore=8, spaceAfter=3)
-    lbl_style   = ps('Lbl',   fontSize=8,  fontName='Helvetica-Bold', textColor=colors.HexColor('#374151'))
-    val_style   = ps('Val',   fontSize=8,  textColor=colors.HexColor('#111827'))
-    rec_style   = ps('Rec',   fontSize=8,  textColor=colors.HexColor('#1f2937'), spaceBefore=2, spaceAfter=1, leftIndent=8)
-    note_style  = ps('Note',  fontSize=7,  textColor=colors.HexColor('#6b7280'))
-    sig_r_style = ps('SigR',  fontSize=7,  textColor=colors.HexColor('#9ca3af'), alignment=TA_RIGHT)
-
-    # ── HEADER ──────────────────────────────────────────────────────────
-    hdr = Table([[
-        Paragraph('<b><font color="#0ea5e9" size="13">SightTech</font></b>', styles['Normal']),
-        Paragraph(
-            f'<font size="8" color="#6b7280">Reporte de Análisis · Retinopatía Diabética'
-            f'<br/>Fecha: {datetime.now().strftime("%d/%m/%Y %H:%M")}</font>',
-            ps('HdrR', alignment=TA_RIGHT, fontSize=8)
-        ),
-    ]], colWidths=[3.5*inch, 3.5*inch])
-    hdr.setStyle(TableStyle([
-        ('VALIGN',      (0,0), (-1,-1), 'MIDDLE'),
-        ('BOTTOMPADDING',(0,0),(-1,-1), 8),
-        ('LINEBELOW',   (0,0), (-1,-1), 1, accent),
-    ]))
-    story.append(hdr)
-    story.append(Spacer(1, 10))
-
-    # ── DIAGNOSIS HERO ──────────────────────────────────────────────────
-    hero = Table([
-        [Paragraph(sev_label, white_big)],
-        [Paragraph(prediction, white_med)],
-        [Paragraph(f'Confianza: {confidence:.1f}%   ·   Nivel: {severity}/5   ·   Imágenes analizadas: {len(images)}', white_sm)],
-    ], colWidths=[7*inch])
-    hero.setStyle(TableStyle([
-        ('BACKGROUND',    (0,0), (-1,-1), sev_color),
-        ('ALIGN',         (0,0), (-1,-1), 'CENTER'),
-        ('TOPPADDING',    (0,0), (-1,-1), 10),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 10),
-    ]))
-    story.append(hero)
-    story.append(Spacer(1, 5))
-
-    # ── ICDRD SCALE ─────────────────────────────────────────────────────
-    scale_cells  = SEV_LABELS[:]
-    scale_styles = [
-        ('FONTSIZE',      (0,0), (-1,-1), 7.5),
-        ('FONTNAME',      (0,0), (-1,-1), 'Helvetica-Bold'),
-        ('ALIGN',         (0,0), (-1,-1), 'CENTER'),
-        ('TOPPADDING',    (0,0), (-1,-1), 4),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 4),
-    ]
-    for i in range(5):
-        filled = i < severity
-        scale_styles.append(('BACKGROUND', (i,0), (i,0),
-            sev_color if filled else colors.HexColor('#e5e7eb')))
-        scale_styles.append(('TEXTCOLOR', (i,0), (i,0),
-            colors.white if filled else colors.HexColor('#9ca3af')))
-    scale_tbl = Table([scale_cells], colWidths=[1.4*inch]*5)
-    scale_tbl.setStyle(TableStyle(scale_styles))
-    story.append(scale_tbl)
-    story.append(Spacer(1, 12))
-
-    # ── TWO-COLUMN: PATIENT + CLINICAL ──────────────────────────────────
-    def info_rows(data):
-        rows = [[Paragraph(f'<b>{k}</b>', lbl_style), Paragraph(str(v or '—'), val_style)] for k, v in data]
-        t = Table(rows, colWidths=[1.75*inch, 1.65*inch])
-        t.setStyle(TableStyle([
-            ('ALIGN',         (0,0), (-1,-1), 'LEFT'),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 4),
-            ('LINEBELOW',     (0,0), (-1,-1), 0.3, colors.HexColor('#e5e7eb')),
-        ]))
-        return t
-
-    def v(key, suffix=''):
-        val = patient_data.get(key)
-        if val in (None, '', 'No especificado'): return '—'
-        return f"{val}{suffix}"
-
-    patient_tbl = info_rows([
-        ('Nombre',           v('name')),
-        ('Edad',             v('age', ' años')),
-        ('Género',           v('gender')),
-        ('Años con diabetes',v('diabetes_years', ' años')),
-        ('Tipo de diabetes', v('diabetes_type','').replace('_',' ').title() if patient_data.get('diabetes_type') else '—'),
-        ('Visión OD',        v('vision_right_eye')),
-        ('Visión OI',        v('vision_left_eye')),
-        ('Medicamentos',     v('medications')),
-        ('Comorbilidades',   v('comorbidities')),
-    ])
-    clinical_tbl = info_rows([
-        ('Glucosa',          v('glucose_level', ' mg/dL')),
-        ('HbA1c',            v('hba1c', '%')),
-        ('Presión arterial', v('blood_pressure')),
-        ('Colesterol',       v('cholesterol', ' mg/dL')),
-        ('IMC',              v('bmi', ' kg/m²')),
-        ('Último exam. ocular', v('last_eye_exam','').replace('_',' ').title() if patient_data.get('last_eye_exam') else '—'),
-        ('Diagnóstico previo',  v('previous_diagnosis','').replace('_',' ').title() if patient_data.get('previous_diagnosis') else '—'),
-    ])
-
-    two_col = Table([
-        [Paragraph('DATOS DEL PACIENTE', sec_title), Paragraph('PARÁMETROS CLÍNICOS', sec_title)],
-        [patient_tbl, clinical_tbl],
-    ], colWidths=[3.5*inch, 3.5*inch])
-    two_col.setStyle(TableStyle([
-        ('VALIGN',       (0,0), (-1,-1), 'TOP'),
-        ('LEFTPADDING',  (1,0), (1,-1),  12),
-    ]))
-    story.append(two_col)
-    story.append(Spacer(1, 10))
-
-    # ── NEXT STEPS ──────────────────────────────────────────────────────
-    urgency_text = URGENCY.get(severity, 'Prioritaria (1-2 semanas)' if severity == 3 else 'Rutina programada')
-    steps_rows = info_rows([
-        ('Urgencia',            urgency_text),
-        ('Próxima revisión',    NEXT_REVIEW.get(severity, '—')),
-        ('Riesgo de progresión',PROG_RISK[severity-1] if 1 <= severity <= 5 else '—'),
-        ('Tratamiento indicado','Sí' if severity >= 3 else 'No'),
-    ])
-    story.append(Paragraph('PRÓXIMOS PASOS', sec_title))
-    story.append(steps_rows)
-    story.append(Spacer(1, 10))
-
-    # ── RECOMMENDATIONS ─────────────────────────────────────────────────
-    story.append(Paragraph('RECOMENDACIONES MÉDICAS', sec_title))
-    for i, rec in enumerate(diagnosis_result.get('recommendations', []), 1):
-        clean = ''.join(c for c in rec if c.isascii() or 0x00C0 <= ord(c) <= 0x024F).strip()
-        story.append(Paragraph(f'{i}. {clean}', rec_style))
-    story.append(Spacer(1, 10))
-
-    # ── RETINAL IMAGES ──────────────────────────────────────────────────
-    if images:
-        story.append(Paragraph('IMÁGENES DE FONDO DE OJO ANALIZADAS', sec_title))
-        img_cells = []
-        for i, image in enumerate(images):
-            try:
-                buf = io.BytesIO()
-                image.save(buf, format='JPEG', quality=85)
-                buf.seek(0)
-                img_cells.append([
-                    Paragraph(f'<b>Imagen {i+1}</b>', lbl_style),
-                    RLImage(buf, width=2.8*inch, height=2.1*inch),
-                ])
-            except Exception:
-                pass
-        if img_cells:
-            img_tbl = Table(img_cells, colWidths=[0.7*inch, 3*inch])
-            img_tbl.setStyle(TableStyle([
-                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-            ]))
-            story.append(img_tbl)
-        story.append(Spacer(1, 10))
-
-    # ── SIGNATURE ───────────────────────────────────────────────────────
-    sig = Table([[
-        Paragraph(f'<b>{physician_name}</b><br/><font color="#6b7280" size="7.5">Médico Tratante</font>', styles['Normal']),
-        Paragraph('Generado por SightTech AI<br/>sighttech.mx', sig_r_style),
-    ]], colWidths=[3.5*inch, 3.5*inch])
-    sig.setStyle(TableStyle([
-        ('LINEABOVE',     (0,0), (0,0),   0.5, colors.HexColor('#d1d5db')),
-        ('ALIGN',         (1,0), (1,0),   'RIGHT'),
-        ('VALIGN',        (0,0), (-1,-1), 'TOP'),
-        ('TOPPADDING',    (0,0), (-1,-1), 6),
-    ]))
-    story.append(sig)
-    story.append(Spacer(1, 6))
-
-    # ── DISCLAIMER ──────────────────────────────────────────────────────
-    story.append(HRFlowable(width='100%', thickness=0.4, color=colors.HexColor('#e5e7eb')))
-    story.append(Spacer(1, 4))
-    story.append(Paragraph(
-        'Nota clínica: Este análisis es una herramienta de apoyo diagnóstico generada por IA. '
-        'El diagnóstico final y la decisión terapéutica son responsabilidad del médico tratante.',
-        note_style
-    ))
-
-    doc.build(story)
+def _report_filename(diagnosis):
+    name = diagnosis.patient.name.replace(' ', '_').replace('/', '_').replace('\\', '_')
+    return f'diagnostico_{diagnosis.id}_{name}.pdf'
+
+def render_diagnosis_report(diagnosis):
+    """Ruta del PDF cacheado del diagnóstico; lo renderiza solo si aún no existe"""
+    pdf_path = report_path(diagnosis.id)
+    if not os.path.exists(pdf_path):
+        started = datetime.now()
+        render_report(pdf_path, **_report_inputs(diagnosis))
+        print(f"📄 Reporte PDF del diagnóstico {diagnosis.id} listo en "
+              f"{(datetime.now() - started).total_seconds():.2f}s")
+    if diagnosis.pdf_path != pdf_path:
+        diagnosis.pdf_path = pdf_path
+        db.session.commit()
     return pdf_path
 
-@app.route('/')
-def index():
-    return render_template('dashboard.html')
+def _render_report_job(diagnosis_id):
+    with app.app_context():
+        try:
+            render_diagnosis_report(db.session.get(Diagnosis, diagnosis_id))
+        except Exception as e:
+            # La descarga lo volverá a intentar
+            print(f"⚠️ No se pudo pre-generar el PDF del diagnóstico {diagnosis_id}: {e}")
+            db.session.rollback()
+
+def schedule_report(diagnosis_id):
+    """Pre-genera el PDF en segundo plano (REPORT_PREGENERATE=0 lo deja para la descarga)"""
+    if os.environ.get('REPORT_PREGENERATE', '1') != '1':
+        return None
+    return _report_executor.submit(_render_report_job, diagnosis_id)
+
+def _verify_image(path):
+    """Valida cabecera y estructura sin decodificar los píxeles"""
+    with Image.open(path) as image:
+        image.verify()
+
+def _store_upload(image_file, check):
+    """Almacena una imagen subida y le aplica ``check`` (se ejecuta en el pool de subidas)"""
+    # Bytes originales al almacén por contenido (deduplicado, sin re-codificar)
+    image_path, digest, created = store_upload(image_file.stream)
+    if not created:
+        print(f"♻️ Imagen ya almacenada: {digest[:12]}")
+
+    try:
+        checked = check(image_path)
+    except Exception:
+        # No conservar blobs que no son imágenes válidas
+        if created:
+            os.remove(image_path)
+        raise
+    return checked, os.path.basename(image_file.filename).lower(), image_path
+
+def _save_uploads(image_files, decode=True):
+    """Guarda las imágenes subidas y devuelve copias para el modelo, nombres y rutas
+
+    Con ``decode=False`` (modo asíncrono) solo las valida: el trabajo las decodifica
+    después desde el disco y las copias devueltas son None.
+    """
+    image_files = [f for f in image_files if f and f.filename]
+    # Copia decodificada a escala reducida solo para el modelo (el PDF usa la ruta)
+    check = open_for_inference if decode else _verify_image
+    # map() conserva el orden de subida, que define image_index en individual_results
+    processed = list(_upload_executor.map(lambda f: _store_upload(f, check), image_files))
+
+    inference_images = [p[0] for p in processed]
+    filenames = [p[1] for p in processed]
+    image_paths = [p[2] for p in processed]
+    return inference_images, filenames, image_paths
+
+def normalize_patient_name(name):
+    return ' '.join((name or '').split()).lower()
+
+def _patient_fields(patient_data):
+    """Columnas de Patient a partir del formulario (None = no informado)"""
+    def as_int(key):
+        return int(patient_data.get(key, 0)) if patient_data.get(key) else None
+
+    def as_float(key):
+        return float(patient_data.get(key, 0)) if patient_data.get(key) else None
+
+    age = as_int('age')
+    birth_year = as_int('birth_year') or (datetime.utcnow().year - age if age else None)
+    return {
+        'name': patient_data.get('name', 'Anónimo'),
+        'age': age,
+        'gender': patient_data.get('gender') or None,
+        'diabetes_years': as_int('diabetes_years'),
+        'diabetes_type': patient_data.get('diabetes_type'),
+        'glucose_level': as_float('glucose_level'),
+        'hba1c': as_float('hba1c'),
+        'blood_pressure': patient_data.get('blood_pressure'),
+        'cholesterol': as_float('cholesterol'),
+        'bmi': as_float('bmi'),
+        'vision_right_eye': patient_data.get('vision_right_eye'),
+        'vision_left_eye': patient_data.get('vision_left_eye'),
+        'medications': patient_data.get('medications'),
+        'comorbidities': patient_data.get('comorbidities'),
+        'last_eye_exam': patient_data.get('last_eye_exam'),
+        'previous_diagnosis': patient_data.get('previous_diagnosis'),
+        'name_key': normalize_patient_name(patient_data.get('name')),
+        'birth_year': birth_year,
+        'clinic': (patient_data.get('clinic') or '').strip(),
+        'external_id': str(patient_data.get('external_id') or '').strip() or None,
+    }
+
+def find_or_create_patient(patient_data):
+    """Reutiliza a un paciente solo si el formulario trae una clave inequívoca: expediente
+    (external_id) en la misma clínica, o nombre + año de nacimiento explícito + clínica; en
+    ambos casos con el mismo género. Sin ella crea uno nuevo (nombre y edad no bastan: dos
+    personas distintas se mezclarían). La ficha existente no se modifica: los datos clínicos
+    de cada visita se guardan en Diagnosis.patient_snapshot. Devuelve (paciente, ya_existía)"""
+    fields = _patient_fields(patient_data)
+    query = None
+    if fields['external_id']:
+        query = Patient.query.filter_by(external_id=fields['external_id'], clinic=fields['clinic'])
+    elif (patient_data.get('birth_year') and fields['clinic']
+          and fields['name_key'] and fields['name_key'] != 'anónimo'):
+        query = Patient.query.filter_by(
+            name_key=fields['name_key'], birth_year=fields['birth_year'], clinic=fields['clinic']
+        )
+
+    patient = None
+    if query is not None:
+        patient = query.filter_by(gender=fields['gender']).order_by(Patient.id).first()
+    if patient is None:
+        patient = Patient(**fields)
+        db.session.add(patient)
+        return patient, False
+
+    print(f"🔁 Paciente existente reutilizado: {patient.id}")
+    return patient, True
+
+def visit_snapshot(patient_data):
+    """Datos del paciente de esta visita (los campos del reporte), para Diagnosis.patient_snapshot"""
+    fields = _patient_fields(patient_data)
+    return {f: fields[f] for f in _PATIENT_REPORT_FIELDS}
+
+def _form_list(data, key):
+    """Valores únicos de {key: [...]} (formulario) o de una lista directa (datos antiguos)"""
+    if isinstance(data, dict):
+        data = data.get(key)
+    if not isinstance(data, list):
+        return []
+    return list(dict.fromkeys(str(value) for value in data if value))
+
+def diagnosis_detail_rows(diagnosis_id, symptoms_data, medical_history_data, recommendations, image_paths):
+    """Filas de las tablas normalizadas de un diagnóstico, como {tabla: [filas]}"""
+    return {
+        DiagnosisSymptom.__table__: [
+            {'diagnosis_id': diagnosis_id, 'symptom': symptom}
+            for symptom in _form_list(symptoms_data, 'symptoms')
+        ],
+        DiagnosisRiskFactor.__table__: [
+            {'diagnosis_id': diagnosis_id, 'factor': factor}
+            for factor in _form_list(medical_history_data, 'risk_factors')
+        ],
+        # Se omiten las líneas vacías que separan secciones; position conserva el orden del JSON
+        DiagnosisRecommendation.__table__: [
+            {'diagnosis_id': diagnosis_id, 'position': i, 'text': text}
+            for i, text in enumerate(recommendations or []) if isinstance(text, str) and text
+        ],
+        DiagnosisImage.__table__: [
+            {'diagnosis_id': diagnosis_id, 'position': i, 'path': path}
+            for i, path in enumerate(image_paths or []) if path
+        ],
+    }
+
+def insert_detail_rows(rows_by_table):
+    """Inserta (executemany por tabla) las filas de diagnosis_detail_rows en la transacción actual"""
+    for table, rows in rows_by_table.items():
+        if rows:
+            db.session.execute(table.insert(), rows)
+
+def run_analysis(inference_images, filenames, image_paths, patient_data,
+                 symptoms_data, medical_history_data, on_progress=None):
+    """Pipeline completo: predicción, recomendaciones y BD. Devuelve la respuesta de /api/analyze
+
+    El PDF no se genera aquí: se encola en segundo plano y /api/download-pdf lo
+    renderiza si todavía no existe.
+    """
+    def progress(stage, **partial):
+        if on_progress:
+            on_progress(stage, partial)
+
+    diagnosis_result = predict_retinopathy(inference_images, filenames=filenames)
+    
+    # Generar recomendaciones personalizadas con puntaje de riesgo
+    diagnosis_result['recommendations'] = generate_recommendations(
+        diagnosis_result['prediction'], 
+        diagnosis_result['confidence'],
+        symptoms_data,
+        medical_history_data,
+        patient_data  # Pasar los datos del paciente para cálculo de riesgo
+    )
+    progress('diagnosis', diagnosis=diagnosis_result)
+    
+    # Paciente y diagnóstico en una sola transacción: un commit, sin huérfanos si algo falla
+    visit = visit_snapshot(patient_data)
+    try:
+        patient, returning = find_or_create_patient(patient_data)
+        db.session.flush()  # Asigna patient.id sin confirmar todavía
+
+        diagnosis = Diagnosis(
+            patient_id=patient.id,
+            image_paths=json.dumps(image_paths),
+            prediction=diagnosis_result['prediction'],
+            confidence=diagnosis_result['confidence'],
+            severity=diagnosis_result['severity'],
+            recommendations=json.dumps(diagnosis_result['recommendations']),
+            symptoms=json.dumps(symptoms_data),
+            medical_history=json.dumps(medical_history_data),
+            physician_name=patient_data.get('physician_name', 'SightTech'),
+            patient_snapshot=json.dumps(visit),
+            details_indexed=True
+        )
+        db.session.add(diagnosis)
+        db.session.flush()  # Asigna diagnosis.id para las filas normalizadas
+        insert_detail_rows(diagnosis_detail_rows(
+            diagnosis.id, symptoms_data, medical_history_data,
+            diagnosis_result['recommendations'], image_paths
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    schedule_report(diagnosis.id)
+    progress('saved', diagnosis_id=diagnosis.id)
+    
+    return {
+        'success': True,
+        'diagnosis': {
+            **diagnosis_result,
+            # Valores de esta visita (la ficha de un paciente existente conserva los de su alta)
+            **{f'patient_{f}': value for f, value in visit.items()},
+            'images_analyzed': len(image_paths)
+        },
+        'patient_id': patient.id,
+        'returning_patient': returning,
+        'diagnosis_id': diagnosis.id,
+        'pdf_url': f'/api/download-pdf/{diagnosis.id}'
+    }
+
+def _update_job(job_id, **fields):
+    job = db.session.get(AnalysisJob, job_id)
+    if job is None:  # Borrado mientras se ejecutaba
+        print(f"⚠️ Trabajo de análisis {job_id} no encontrado")
+        return
+    for key, value in fields.items():
+        setattr(job, key, value)
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+
+def _run_analysis_job(job_id):
+    """Ejecuta en segundo plano el pipeline de un trabajo a partir de sus entradas persistidas"""
+    with app.app_context():
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None:
+            print(f"⚠️ Trabajo de análisis {job_id} no encontrado")
+            return
+        saved = _json_or_none(job.result)
+        if isinstance(saved, dict) and saved.get('diagnosis_id'):
+            # El diagnóstico ya se guardó (etapa 'saved') antes de un reinicio: repetir el
+            # análisis duplicaría paciente y diagnóstico
+            diagnosis_id = saved['diagnosis_id']
+            _update_job(job_id, status='completed', stage='done', diagnosis_id=diagnosis_id,
+                        result=json.dumps({'success': True, **saved,
+                                           'pdf_url': f'/api/download-pdf/{diagnosis_id}'}))
+            print(f"✅ Trabajo de análisis {job_id} completado con el diagnóstico ya guardado")
+            return
+        try:
+            inputs = json.loads(job.inputs)
+            partial = {}
+            _update_job(job_id, status='running', stage='inference')
+
+            inference_images = [open_for_inference(path) for path in inputs['image_paths']]
+
+            def on_progress(stage, data):
+                partial.update(data)
+                _update_job(job_id, stage=stage, result=json.dumps(partial))
+
+            response = run_analysis(
+                inference_images, inputs['filenames'], inputs['image_paths'],
+                inputs['patient_data'], inputs['symptoms_data'], inputs['medical_history_data'],
+                on_progress=on_progress
+            )
+            _update_job(job_id, status='completed', stage='done', result=json.dumps(response),
+                        diagnosis_id=response['diagnosis_id'])
+            print(f"✅ Trabajo de análisis {job_id} completado")
+        except Exception as e:
+            print(f"❌ Error en trabajo de análisis {job_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            _update_job(job_id, status='failed', error=str(e))
+
+def submit_analysis_job(job_id):
+    return _analysis_executor.submit(_run_analysis_job, job_id)
+
+def resume_pending_jobs():
+    """Re-encola trabajos que quedaron pendientes por un reinicio del servidor"""
+    pending = AnalysisJob.query.filter(AnalysisJob.status.in_(('queued', 'running'))).all()
+    for job in pending:
+        print(f"🔁 Reanudando trabajo de análisis {job.id}")
+        submit_analysis_job(job.id)
+    return len(pending)
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze_image():
-    """Endpoint para analizar imágenes de retinopatía"""
+    """Endpoint para analizar imágenes de retinopatía (con ?async=1 devuelve un job id)"""
     try:
         print("🔍 Iniciando análisis de imágenes...")
         
@@ -641,6 +1053,7 @@ def analyze_image():
         patient_data = json.loads(request.form.get('patient_data', '{}'))
         symptoms_data = json.loads(request.form.get('symptoms_data', '{}'))
         medical_history_data = json.loads(request.form.get('medical_history_data', '{}'))
+        async_mode = (request.args.get('async') or request.form.get('async', '')).lower() in ('1', 'true', 'yes')
         
         print(f"👤 Datos del paciente: {patient_data}")
         
@@ -648,105 +1061,40 @@ def analyze_image():
             return jsonify({'error': 'No se proporcionaron imágenes'}), 400
         
         # Procesar múltiples imágenes
-        images = []
-        image_paths = []
-        filenames = []
-
-        for i, image_file in enumerate(image_files):
-            if image_file and image_file.filename:
-                image = Image.open(image_file.stream)
-                images.append(image)
-                filenames.append(os.path.basename(image_file.filename).lower())
-
-                # Guardar imagen
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                image_path = f"uploads/{timestamp}_{i}_{image_file.filename}"
-                os.makedirs('uploads', exist_ok=True)
-                image.save(image_path)
-                image_paths.append(image_path)
-
-        if not images:
+        # En modo asíncrono solo se validan: el trabajo las decodifica desde el disco
+        inference_images, filenames, image_paths = _save_uploads(image_files, decode=not async_mode)
+
+        if not image_paths:
             return jsonify({'error': 'No se pudieron procesar las imágenes'}), 400
 
-        diagnosis_result = predict_retinopathy(images, filenames=filenames)
-        
-        # Generar recomendaciones personalizadas con puntaje de riesgo
-        diagnosis_result['recommendations'] = generate_recommendations(
-            diagnosis_result['prediction'], 
-            diagnosis_result['confidence'],
-            symptoms_data,
-            medical_history_data,
-            patient_data  # Pasar los datos del paciente para cálculo de riesgo
-        )
-        
-        # Crear paciente en BD
-        patient = Patient(
-            name=patient_data.get('name', 'Anónimo'),
-            age=int(patient_data.get('age', 0)) if patient_data.get('age') else None,
-            gender=patient_data.get('gender'),
-            diabetes_years=int(patient_data.get('diabetes_years', 0)) if patient_data.get('diabetes_years') else None,
-            diabetes_type=patient_data.get('diabetes_type'),
-            glucose_level=float(patient_data.get('glucose_level', 0)) if patient_data.get('glucose_level') else None,
-            hba1c=float(patient_data.get('hba1c', 0)) if patient_data.get('hba1c') else None,
-            blood_pressure=patient_data.get('blood_pressure'),
-            cholesterol=float(patient_data.get('cholesterol', 0)) if patient_data.get('cholesterol') else None,
-            bmi=float(patient_data.get('bmi', 0)) if patient_data.get('bmi') else None,
-            vision_right_eye=patient_data.get('vision_right_eye'),
-            vision_left_eye=patient_data.get('vision_left_eye'),
-            medications=patient_data.get('medications'),
-            comorbidities=patient_data.get('comorbidities'),
-            last_eye_exam=patient_data.get('last_eye_exam'),
-            previous_diagnosis=patient_data.get('previous_diagnosis')
-        )
-        db.session.add(patient)
-        db.session.commit()
-        
-        # Crear PDF primero
-        physician_name = patient_data.get('physician_name', 'SightTech')
-        pdf_path = create_pdf_report(patient_data, images, diagnosis_result, physician_name)
-        
-        # Crear diagnóstico en BD
-        diagnosis = Diagnosis(
-            patient_id=patient.id,
-            image_paths=json.dumps(image_paths),
-            prediction=diagnosis_result['prediction'],
-            confidence=diagnosis_result['confidence'],
-            severity=diagnosis_result['severity'],
-            recommendations=json.dumps(diagnosis_result['recommendations']),
-            symptoms=json.dumps(symptoms_data),
-            medical_history=json.dumps(medical_history_data),
-            pdf_path=pdf_path  # Guardar la ruta del PDF
-        )
-        db.session.add(diagnosis)
-        db.session.commit()
-        
+        if async_mode:
+            job = AnalysisJob(
+                id=uuid.uuid4().hex,
+                status='queued',
+                stage='queued',
+                inputs=json.dumps({
+                    'image_paths': image_paths,
+                    'filenames': filenames,
+                    'patient_data': patient_data,
+                    'symptoms_data': symptoms_data,
+                    'medical_history_data': medical_history_data
+                })
+            )
+            db.session.add(job)
+            db.session.commit()
+            submit_analysis_job(job.id)
+            print(f"📥 Trabajo de análisis {job.id} encolado")
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': f'/api/jobs/{job.id}'
+            }), 202
+
+        response = run_analysis(inference_images, filenames, image_paths,
+                                patient_data, symptoms_data, medical_history_data)
         print("✅ Análisis completado exitosamente")
-        return jsonify({
-            'success': True,
-            'diagnosis': {
-                **diagnosis_result,
-                'patient_name': patient.name,
-                'patient_age': patient.age,
-                'patient_gender': patient.gender,
-                'patient_diabetes_years': patient.diabetes_years,
-                'patient_diabetes_type': patient.diabetes_type,
-                'patient_glucose_level': patient.glucose_level,
-                'patient_hba1c': patient.hba1c,
-                'patient_blood_pressure': patient.blood_pressure,
-                'patient_cholesterol': patient.cholesterol,
-                'patient_bmi': patient.bmi,
-                'patient_vision_right_eye': patient.vision_right_eye,
-                'patient_vision_left_eye': patient.vision_left_eye,
-                'patient_medications': patient.medications,
-                'patient_comorbidities': patient.comorbidities,
-                'patient_last_eye_exam': patient.last_eye_exam,
-                'patient_previous_diagnosis': patient.previous_diagnosis,
-                'images_analyzed': len(images)
-            },
-            'patient_id': patient.id,
-            'diagnosis_id': diagnosis.id,
-            'pdf_path': pdf_path
-        })
+        return jsonify(response)
         
     except Exception as e:
         print(f"❌ Error en análisis: {e}")
@@ -754,52 +1102,193 @@ def analyze_image():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Estado y resultados parciales de un trabajo de análisis asíncrono"""
+    try:
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'stage': job.stage,
+            'result': json.loads(job.result) if job.result else None,
+            'error': job.error,
+            'diagnosis_id': job.diagnosis_id,
+            'created_at': job.created_at.isoformat(),
+            'updated_at': job.updated_at.isoformat() if job.updated_at else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/download-pdf/<int:diagnosis_id>')
 def download_pdf(diagnosis_id):
-    """Descargar PDF del diagnóstico"""
+    """Descargar PDF del diagnóstico (se renderiza en la primera descarga si hace falta)"""
     try:
-        diagnosis = Diagnosis.query.get_or_404(diagnosis_id)
-        
-        if not diagnosis.pdf_path:
-            return jsonify({'error': 'PDF no encontrado para este diagnóstico'}), 404
-            
-        if not os.path.exists(diagnosis.pdf_path):
-            return jsonify({'error': 'Archivo PDF no encontrado en el servidor'}), 404
-            
+        diagnosis = db.session.get(Diagnosis, diagnosis_id)
+        if diagnosis is None:
+            return jsonify({'error': 'Diagnóstico no encontrado'}), 404
+
+        pdf_path = render_diagnosis_report(diagnosis)
         return send_file(
-            diagnosis.pdf_path, 
+            os.path.abspath(pdf_path), 
             as_attachment=True, 
-            download_name=f'diagnostico_{diagnosis_id}_{diagnosis.patient.name.replace(" ", "_")}.pdf'
+            download_name=_report_filename(diagnosis)
         )
     except Exception as e:
         print(f"❌ Error descargando PDF: {e}")
         return jsonify({'error': str(e)}), 500
 
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_QUERY_BATCH = 100
+
+class _ZipStream:
+    """Destino no buscable para ZipFile: acumula lo escrito hasta que el generador lo entrega"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _export_ready_reports(diagnosis_ids):
+    """Genera (nombre, ruta, error) a medida que cada PDF está listo; los faltantes se
+    renderizan en el pool de procesos con una ventana acotada de trabajos en vuelo"""
+    pool = _get_export_pool()
+    window = EXPORT_WORKERS * 2
+    in_flight = {}
+
+    def finished(done):
+        for future in done:
+            arcname, path = in_flight.pop(future)
+            try:
+                future.result()
+                yield arcname, path, None
+            except Exception as e:
+                yield arcname, None, str(e)
+
+    for start in range(0, len(diagnosis_ids), EXPORT_QUERY_BATCH):
+        batch_ids = diagnosis_ids[start:start + EXPORT_QUERY_BATCH]
+        diagnoses = Diagnosis.query.options(db.joinedload(Diagnosis.patient)) \
+            .filter(Diagnosis.id.in_(batch_ids)).order_by(Diagnosis.id).all()
+        for diagnosis in diagnoses:
+            arcname, path = _report_filename(diagnosis), report_path(diagnosis.id)
+            if os.path.exists(path):
+                yield arcname, path, None
+                continue
+            while len(in_flight) >= window:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+            future = pool.submit(render_report, path, **_report_inputs(diagnosis))
+            in_flight[future] = (arcname, path)
+        db.session.expunge_all()
+
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        yield from finished(done)
+
+def _stream_reports_zip(diagnosis_ids):
+    """ZIP escrito al vuelo: en memoria solo hay un bloque de un PDF a la vez"""
+    sink = _ZipStream()
+    errors = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for arcname, path, error in _export_ready_reports(diagnosis_ids):
+            if error:
+                errors.append(f'{arcname}: {error}')
+                continue
+            with open(path, 'rb') as src, zf.open(arcname, 'w') as dest:
+                while True:
+                    chunk = src.read(EXPORT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+        if errors:
+            zf.writestr('errores.txt', '\n'.join(errors))
+    yield sink.drain()
+    print(f"📦 Exportación de {len(diagnosis_ids)} reportes terminada ({len(errors)} errores)")
+
+def _id_list(value):
+    return [int(v) for v in value.split(',') if v.strip()] if value else []
+
+@app.route('/api/export/reports')
+def export_reports():
+    """ZIP con los PDF de un rango de fechas (?from=&to=, YYYY-MM-DD, ambos inclusive)
+    o de una lista de diagnósticos (?ids=) o pacientes (?patient_ids=)"""
+    try:
+        ids, patient_ids = _id_list(request.args.get('ids')), _id_list(request.args.get('patient_ids'))
+        date_from, date_to = request.args.get('from'), request.args.get('to')
+        if not (ids or patient_ids or date_from or date_to):
+            return jsonify({'error': 'Indique un rango de fechas (from/to), ids o patient_ids'}), 400
+
+        query = db.session.query(Diagnosis.id)
+        if ids:
+            query = query.filter(Diagnosis.id.in_(ids))
+        if patient_ids:
+            query = query.filter(Diagnosis.patient_id.in_(patient_ids))
+        if date_from:
+            query = query.filter(Diagnosis.created_at >= datetime.strptime(date_from, '%Y-%m-%d'))
+        if date_to:
+            query = query.filter(Diagnosis.created_at < datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+        diagnosis_ids = [row.id for row in query.order_by(Diagnosis.id)]
+        if not diagnosis_ids:
+            return jsonify({'error': 'No hay diagnósticos para exportar'}), 404
+
+        print(f"📦 Exportando {len(diagnosis_ids)} reportes...")
+        return Response(
+            stream_with_context(_stream_reports_zip(diagnosis_ids)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename=reportes_{datetime.now():%Y%m%d_%H%M%S}.zip'}
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+    except Exception as e:
+        print(f"❌ Error exportando reportes: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/dashboard')
 def dashboard():
     """Endpoint para obtener estadísticas del dashboard"""
     try:
-        total_patients = Patient.query.count()
-        total_diagnoses = Diagnosis.query.count()
+        # Contadores precalculados (dashboard_stat): costo constante sin importar el volumen
+        today_key = f'day:{datetime.utcnow().date().isoformat()}'
+        stats = {s.key: s for s in DashboardStat.query.filter(db.or_(
+            DashboardStat.key.in_(('patients', 'diagnoses', 'confidence', today_key)),
+            DashboardStat.key.like('severity:%')
+        ))}
 
-        # Confianza promedio
-        avg_conf_raw = db.session.query(db.func.avg(Diagnosis.confidence)).scalar()
-        avg_confidence = round(float(avg_conf_raw), 1) if avg_conf_raw else 0
+        def stat_count(key):
+            return stats[key].count if key in stats else 0
 
-        # Diagnósticos de hoy
-        today = datetime.utcnow().date()
-        today_diagnoses = Diagnosis.query.filter(
-            db.func.date(Diagnosis.created_at) == today
-        ).count()
+        total_patients = stat_count('patients')
+        total_diagnoses = stat_count('diagnoses')
+        today_diagnoses = stat_count(today_key)
 
-        # Estadísticas por severidad
-        severity_stats = db.session.query(
-            Diagnosis.severity,
-            db.func.count(Diagnosis.id)
-        ).group_by(Diagnosis.severity).all()
+        # Confianza promedio
+        confidence = stats.get('confidence')
+        avg_confidence = round(confidence.total / confidence.count, 1) if confidence and confidence.count else 0
+
+        # Estadísticas por severidad (las filas sin severidad solo cuentan en los totales)
+        severity_stats = [
+            (int(key.split(':', 1)[1]), stat.count)
+            for key, stat in stats.items()
+            if key.startswith('severity:') and key != 'severity:None' and stat.count
+        ]
 
-        # Diagnósticos recientes
-        recent_diagnoses = Diagnosis.query.order_by(Diagnosis.created_at.desc()).limit(10).all()
+        # Diagnósticos recientes con su paciente en la misma consulta (JOIN, sin N+1)
+        recent_diagnoses = Diagnosis.query.options(db.joinedload(Diagnosis.patient)) \
+            .order_by(Diagnosis.created_at.desc()).limit(10).all()
 
         return jsonify({
             'total_patients': total_patients,
@@ -824,19 +1313,200 @@ def dashboard():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/dashboard/reconcile', methods=['POST'])
+def reconcile_dashboard():
+    """Reconstruye los contadores del dashboard desde las tablas"""
+    try:
+        keys = reconcile_stats()
+        return jsonify({'success': True, 'keys': keys})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ready')
+def ready():
+    """Readiness para el balanceador: 503 hasta que termine el calentamiento del modelo,
+    y también si falló (salvo READY_WITHOUT_MODEL=1)"""
+    ready_states = ('ready', 'skipped', 'failed') if READY_WITHOUT_MODEL else ('ready', 'skipped')
+    is_ready = _model_warmup['status'] in ready_states
+    return jsonify({
+        'ready': is_ready,
+        'model': _model_warmup
+    }), 200 if is_ready else 503
+
+@app.route('/api/inference/stats')
+def inference_stats():
+    """Estadísticas de inferencia: planificador, pool de procesos y caché de predicciones"""
+    try:
+        try:
+            from real_ai_model import get_pool_stats, get_scheduler_stats
+            scheduler, pool = get_scheduler_stats(), get_pool_stats()
+        except ImportError:
+            scheduler, pool = None, None
+        return jsonify({
+            'scheduler': scheduler,
+            'pool': pool,
+            'prediction_cache': prediction_cache.stats()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+PATIENT_LIST_FIELDS = ('id', 'name', 'age', 'gender', 'created_at', 'diagnoses_count')
+PATIENT_PAGE_DEFAULT = 50
+PATIENT_PAGE_MAX = 500
+
+def _encode_cursor(created_at, patient_id):
+    raw = f'{created_at.isoformat()}|{patient_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, patient_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(patient_id)
+
 @app.route('/api/patients')
 def get_patients():
-    """Obtener lista de pacientes"""
+    """Lista de pacientes, más recientes primero, paginada por cursor sobre (created_at, id)
+
+    ?limit=N (máx. 500), ?fields=id,name,... y ?cursor= con el valor de la cabecera
+    X-Next-Cursor de la página anterior (también en Link rel="next").
+    """
     try:
-        patients = Patient.query.order_by(Patient.created_at.desc()).all()
-        return jsonify([{
-            'id': p.id,
-            'name': p.name,
-            'age': p.age,
-            'gender': p.gender,
-            'created_at': p.created_at.isoformat(),
-            'diagnoses_count': len(p.diagnoses)
-        } for p in patients])
+        limit = min(max(int(request.args.get('limit', PATIENT_PAGE_DEFAULT)), 1), PATIENT_PAGE_MAX)
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or list(PATIENT_LIST_FIELDS)
+        unknown = set(fields) - set(PATIENT_LIST_FIELDS)
+        if unknown:
+            return jsonify({'error': f'Campos desconocidos: {", ".join(sorted(unknown))}'}), 400
+
+        # id y created_at siempre: forman el cursor
+        columns = [Patient.id, Patient.created_at]
+        columns += [getattr(Patient, f) for f in fields if f in ('name', 'age', 'gender')]
+        if 'diagnoses_count' in fields:
+            # Subconsulta correlacionada: solo cuenta los pacientes de esta página (índice por patient_id)
+            columns.append(
+                db.select(db.func.count(Diagnosis.id))
+                .where(Diagnosis.patient_id == Patient.id)
+                .scalar_subquery().label('diagnoses_count')
+            )
+
+        query = db.session.query(*columns)
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                after = _decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Cursor inválido'}), 400
+            # Keyset: continúa justo después de la última fila vista, sin OFFSET
+            query = query.filter(db.tuple_(Patient.created_at, Patient.id) < after)
+        rows = query.order_by(Patient.created_at.desc(), Patient.id.desc()).limit(limit + 1).all()
+
+        page = rows[:limit]
+        response = jsonify([{
+            f: row.created_at.isoformat() if f == 'created_at' else getattr(row, f)
+            for f in fields
+        } for row in page])
+        if len(rows) > limit:
+            next_cursor = _encode_cursor(page[-1].created_at, page[-1].id)
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = (
+                f'<{request.path}?{urlencode({**request.args.to_dict(), "cursor": next_cursor})}>; rel="next"'
+            )
+        return response
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+DIAGNOSIS_LIST_FIELDS = ('id', 'patient_id', 'prediction', 'severity', 'confidence', 'created_at')
+
+def _name_list(value):
+    return [v.strip() for v in value.split(',') if v.strip()] if value else []
+
+def _diagnosis_filters(args):
+    """Condiciones SQL de los filtros de /api/diagnoses (se combinan con AND)
+
+    symptom= y risk_factor= (separados por coma: el diagnóstico debe tener todos), severity=
+    (uno o varios), min_severity=, min_confidence=, from=/to= (YYYY-MM-DD, inclusive),
+    patient_ids= e image= (ruta almacenada). Síntomas, factores e imágenes se resuelven con
+    los índices de sus tablas, sin leer los JSON.
+    """
+    conditions = []
+    for symptom in _name_list(args.get('symptom')):
+        conditions.append(Diagnosis.id.in_(
+            db.select(DiagnosisSymptom.diagnosis_id).where(DiagnosisSymptom.symptom == symptom)))
+    for factor in _name_list(args.get('risk_factor')):
+        conditions.append(Diagnosis.id.in_(
+            db.select(DiagnosisRiskFactor.diagnosis_id).where(DiagnosisRiskFactor.factor == factor)))
+    if args.get('image'):
+        conditions.append(Diagnosis.id.in_(
+            db.select(DiagnosisImage.diagnosis_id).where(DiagnosisImage.path == args['image'])))
+
+    severities = _id_list(args.get('severity'))
+    if severities:
+        conditions.append(Diagnosis.severity.in_(severities))
+    if args.get('min_severity'):
+        conditions.append(Diagnosis.severity >= int(args['min_severity']))
+    if args.get('min_confidence'):
+        conditions.append(Diagnosis.confidence >= float(args['min_confidence']))
+    patient_ids = _id_list(args.get('patient_ids'))
+    if patient_ids:
+        conditions.append(Diagnosis.patient_id.in_(patient_ids))
+    if args.get('from'):
+        conditions.append(Diagnosis.created_at >= datetime.strptime(args['from'], '%Y-%m-%d'))
+    if args.get('to'):
+        conditions.append(Diagnosis.created_at < datetime.strptime(args['to'], '%Y-%m-%d') + timedelta(days=1))
+    return conditions
+
+@app.route('/api/diagnoses')
+def get_diagnoses():
+    """Diagnósticos que cumplen los filtros (ver _diagnosis_filters), más recientes primero
+
+    Paginada igual que /api/patients: ?limit=N (máx. 500) y ?cursor= con el valor de
+    X-Next-Cursor (también en Link rel="next").
+    Ejemplo: /api/diagnoses?symptom=perdida_vision&severity=4
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', PATIENT_PAGE_DEFAULT)), 1), PATIENT_PAGE_MAX)
+        query = db.session.query(*[getattr(Diagnosis, f) for f in DIAGNOSIS_LIST_FIELDS]) \
+            .filter(*_diagnosis_filters(request.args))
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                after = _decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Cursor inválido'}), 400
+            query = query.filter(db.tuple_(Diagnosis.created_at, Diagnosis.id) < after)
+        rows = query.order_by(Diagnosis.created_at.desc(), Diagnosis.id.desc()).limit(limit + 1).all()
+
+        page = rows[:limit]
+        response = jsonify([{
+            f: row.created_at.isoformat() if f == 'created_at' and row.created_at else getattr(row, f)
+            for f in DIAGNOSIS_LIST_FIELDS
+        } for row in page])
+        if len(rows) > limit:
+            next_cursor = _encode_cursor(page[-1].created_at, page[-1].id)
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = (
+                f'<{request.path}?{urlencode({**request.args.to_dict(), "cursor": next_cursor})}>; rel="next"'
+            )
+        return response
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/diagnoses/count')
+def count_diagnoses():
+    """Tamaño de una cohorte con los mismos filtros que /api/diagnoses, total y por severidad"""
+    try:
+        rows = db.session.query(Diagnosis.severity, db.func.count(Diagnosis.id)) \
+            .filter(*_diagnosis_filters(request.args)).group_by(Diagnosis.severity).all()
+        return jsonify({
+            'count': sum(count for _, count in rows),
+            'by_severity': {severity: count for severity, count in rows if severity is not None},
+        })
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -846,8 +1516,11 @@ def generate_demo_data():
     try:
         from generate_demo_data import generar_datos_demo
         
-        # Generar datos de demo
-        pacientes_creados, diagnosticos_creados = generar_datos_demo()
+        # Generar datos de demo sin borrar los existentes (reproducibles con "seed")
+        params = request.get_json(silent=True) or {}
+        pacientes_creados, diagnosticos_creados = generar_datos_demo(
+            min(int(params.get('patients', 20)), 10000), seed=params.get('seed'), append=True
+        )
         
         return jsonify({
             'success': True,
@@ -1011,19 +1684,118 @@ def chat_with_ai():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+# Columnas añadidas después de la primera versión del esquema (create_all no altera tablas)
+_ADDED_COLUMNS = {
+    'diagnosis': {'physician_name': 'VARCHAR(100)', 'details_indexed': 'BOOLEAN DEFAULT FALSE',
+                  'patient_snapshot': 'TEXT'},
+    'patient': {'name_key': 'VARCHAR(100)', 'birth_year': 'INTEGER', 'clinic': "VARCHAR(100) DEFAULT ''",
+                'external_id': 'VARCHAR(100)'},
+}
+
+def migrate_db():
+    """Añade a una BD existente las columnas e índices que le falten (sin reconstruir tablas)"""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+                    print(f"🛠️ Columna {table}.{name} añadida")
+
+        for table in db.metadata.sorted_tables:
+            existing = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn, checkfirst=True)
+                    print(f"🛠️ Índice {index.name} creado")
+
+    _backfill_patient_keys()
+    _backfill_diagnosis_details()
+
+def _backfill_patient_keys(batch_size=1000):
+    """Calcula la clave natural de pacientes creados antes de que existiera"""
+    total = 0
+    while True:
+        rows = db.session.query(Patient.id, Patient.name, Patient.age, Patient.created_at) \
+            .filter(Patient.name_key.is_(None)).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(db.update(Patient), [{
+            'id': row.id,
+            'name_key': normalize_patient_name(row.name),
+            'birth_year': (row.created_at or datetime.utcnow()).year - row.age if row.age else None,
+        } for row in rows])
+        db.session.commit()
+        total += len(rows)
+    if total:
+        print(f"🛠️ Clave natural calculada para {total} pacientes")
+
+def _json_or_none(text):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return None
+
+def _backfill_diagnosis_details(batch_size=1000):
+    """Normaliza los JSON de los diagnósticos pendientes (details_indexed falso) en sus tablas"""
+    detail_tables = [DiagnosisSymptom.__table__, DiagnosisRiskFactor.__table__,
+                     DiagnosisRecommendation.__table__, DiagnosisImage.__table__]
+    total = 0
+    while True:
+        rows = db.session.query(
+            Diagnosis.id, Diagnosis.symptoms, Diagnosis.medical_history,
+            Diagnosis.recommendations, Diagnosis.image_paths
+        ).filter(Diagnosis.details_indexed == db.false()) \
+            .order_by(Diagnosis.id).limit(batch_size).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        pending = {table: [] for table in detail_tables}
+        for row in rows:
+            details = diagnosis_detail_rows(
+                row.id, _json_or_none(row.symptoms), _json_or_none(row.medical_history),
+                _json_or_none(row.recommendations), _json_or_none(row.image_paths)
+            )
+            for table, table_rows in details.items():
+                pending[table].extend(table_rows)
+        # Idempotente: si algo escribió filas sin marcar el diagnóstico, se reemplazan
+        for table in detail_tables:
+            db.session.execute(table.delete().where(table.c.diagnosis_id.in_(ids)))
+        insert_detail_rows(pending)
+        db.session.execute(db.update(Diagnosis), [{'id': i, 'details_indexed': True} for i in ids])
+        db.session.commit()
+        total += len(rows)
+    if total:
+        print(f"🛠️ Síntomas, factores de riesgo, recomendaciones e imágenes normalizados "
+              f"para {total} diagnósticos")
+
 # Inicializar base de datos
-def init_db():
+def init_db(preload_model=None):
+    if preload_model is None:
+        preload_model = os.environ.get('PRELOAD_MODEL', '1') == '1'
+    if preload_model:
+        start_model_warmup()
+    else:
+        _model_warmup['status'] = 'skipped'
+
     with app.app_context():
         try:
             # Solo crea tablas si no existen — nunca borra datos existentes
             db.create_all()
+            migrate_db()
             print("✅ Base de datos lista")
 
+            # BD previa a dashboard_stat (o cargada en bloque): reconstruir los contadores
+            if DashboardStat.query.count() == 0 and Patient.query.first() is not None:
+                reconcile_stats()
+            _start_stats_reconciler()
+
             # Generar datos de demo solo si la BD está vacía (primer arranque)
             if Patient.query.count() == 0:
                 try:
                     from generate_demo_data import generar_datos_demo
-                    pacientes_creados, diagnosticos_creados = generar_datos_demo()
+                    pacientes_creados, diagnosticos_creados = generar_datos_demo(append=True)
                     print(f"🎯 Datos de demo generados: {pacientes_creados} pacientes, {diagnosticos_creados} diagnósticos")
                 except Exception as e:
                     print(f"⚠️ No se pudieron generar datos de demo: {e}")
@@ -1034,6 +1806,10 @@ def init_db():
             else:
                 print(f"📋 BD existente con {Patient.query.count()} pacientes — datos preservados")
 
+            resumed = resume_pending_jobs()
+            if resumed:
+                print(f"🔁 {resumed} trabajos de análisis reanudados")
+
         except Exception as e:
             print(f"❌ Error inicializando base de datos: {e}")
             raise e
@@ -1043,11 +1819,12 @@ def get_diagnosis(diagnosis_id):
     """Obtiene detalles de un diagnóstico individual"""
     try:
         d = Diagnosis.query.get_or_404(diagnosis_id)
+        visit = visit_patient_data(d)
         return jsonify({
             'id': d.id,
-            'patient_name': d.patient.name,
-            'patient_age': d.patient.age,
-            'patient_gender': d.patient.gender,
+            'patient_name': visit['name'],
+            'patient_age': visit['age'],
+            'patient_gender': visit['gender'],
             'prediction': d.prediction,
             'confidence': d.confidence,
             'severity': d.severity,
@@ -1056,6 +1833,52 @@ def get_diagnosis(diagnosis_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+_IMAGE_SIZES = ('thumb', 'preview', 'original')
+_IMAGE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+@app.route('/api/diagnosis/<int:diagnosis_id>/images/<int:index>')
+def get_diagnosis_image(diagnosis_id, index):
+    """Imagen <index> (base 0, como image_index) de un diagnóstico: ?size=thumb|preview|original"""
+    try:
+        size = request.args.get('size', 'thumb')
+        if size not in _IMAGE_SIZES:
+            return jsonify({'error': f'Tamaño inválido; opciones: {", ".join(_IMAGE_SIZES)}'}), 400
+
+        diagnosis = db.session.get(Diagnosis, diagnosis_id)
+        if diagnosis is None:
+            return jsonify({'error': 'Diagnóstico no encontrado'}), 404
+        image_paths = json.loads(diagnosis.image_paths or '[]')
+        if not 0 <= index < len(image_paths) or not os.path.exists(image_paths[index]):
+            return jsonify({'error': 'Imagen no encontrada'}), 404
+
+        original = image_paths[index]
+        # Los blobs se nombran por su SHA-256: sirve como ETag fuerte de la imagen y sus derivados
+        digest = os.path.splitext(os.path.basename(original))[0]
+        content_addressed = len(digest) == 64
+
+        if size == 'original':
+            path, etag = original, digest
+        else:
+            # Solo si el cliente nombra image/webp: */* o image/* no garantizan que lo decodifique
+            webp = any(value.lower() == 'image/webp' and quality > 0
+                       for value, quality in request.accept_mimetypes)
+            image_format = 'WEBP' if webp else VARIANTS[size]['format']
+            path = ensure_derivative(original, size, image_format)
+            etag = f'{digest}-{size}-v{DERIVATIVE_VERSION}-{image_format.lower()}'
+
+        response = send_file(
+            os.path.abspath(path),
+            conditional=True,  # If-None-Match → 304, Range → 206
+            etag=etag if content_addressed else True
+        )
+        if size != 'original':
+            response.vary.add('Accept')  # El formato del derivado depende de Accept
+        response.headers['Cache-Control'] = _IMAGE_CACHE_CONTROL if content_addressed else 'private, no-cache'
+        return response
+    except Exception as e:
+        print(f"❌ Error sirviendo imagen: {e}")
+        return jsonify({'error': str(e)}), 500
+
 
 def generar_datos_basicos():
     """Generar datos básicos de demo si falla el script principal"""
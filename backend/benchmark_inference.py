@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inferencia del ResNet50-APTOS por backend.
+
+Cada backend se mide en un proceso nuevo (spawn) para que el arranque en frío
+y el RSS máximo no se contaminen entre sí. Se reporta:
+
+- cold start: carga del modelo + primer forward pass
+- decodificación y preprocesamiento por imagen (JPEG sintético de fondo de ojo)
+- latencia p50/p95/p99 por lote e imágenes/s, por tamaño de lote y nº de hilos
+- latencia de una visita completa (predict_retinopathy_with_real_ai)
+- RSS máximo del proceso
+
+Uso:
+    python benchmark_inference.py --backends torch,onnx --batch-sizes 1,4,8,16 \\
+        --threads 1,2,4 --output bench_$(date +%Y%m%d).json
+"""
+
+import argparse
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+
+from model_config import MODEL_CONFIG
+from test_resnet50 import create_test_image
+
+
+def _percentiles(samples_ms):
+    samples = np.array(samples_ms)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 2),
+        'p95_ms': round(float(np.percentile(samples, 95)), 2),
+        'p99_ms': round(float(np.percentile(samples, 99)), 2),
+        'mean_ms': round(float(samples.mean()), 2),
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+def _synthetic_jpegs(count, image_size):
+    blobs = []
+    for i in range(count):
+        buf = io.BytesIO()
+        create_test_image(image_size, fundus=True, seed=i).save(buf, format='JPEG', quality=90)
+        blobs.append(buf.getvalue())
+    return blobs
+
+
+def _bench_backend(backend, batch_sizes, thread_counts, iterations, image_size, visit_size):
+    """Se ejecuta en un proceso hijo: mide un backend de principio a fin"""
+    import torch
+
+    import real_ai_model
+    from preprocessing import open_for_inference, preprocess_batch
+
+    # Medir el backend directamente, sin pool ni planificador en medio
+    real_ai_model.MODEL_CONFIG['backend'] = backend
+    real_ai_model.POOL_CONFIG['enabled'] = False
+    real_ai_model.SCHEDULER_CONFIG['enabled'] = False
+
+    result = {'backend': backend}
+
+    started = time.perf_counter()
+    model = real_ai_model._load_model()
+    height, width = MODEL_CONFIG['input_size']
+    real_ai_model._infer_probabilities(model, torch.zeros(1, 3, height, width))
+    result['cold_start_s'] = round(time.perf_counter() - started, 3)
+
+    jpegs = _synthetic_jpegs(max(batch_sizes + [visit_size]), image_size)
+    decode_ms, preprocess_ms = [], []
+    images = []
+    for data in jpegs:
+        t0 = time.perf_counter()
+        image = open_for_inference(data)
+        t1 = time.perf_counter()
+        preprocess_batch([image])
+        t2 = time.perf_counter()
+        decode_ms.append((t1 - t0) * 1000)
+        preprocess_ms.append((t2 - t1) * 1000)
+        images.append(image)
+    result['decode_per_image'] = _percentiles(decode_ms)
+    result['preprocess_per_image'] = _percentiles(preprocess_ms)
+
+    result['runs'] = []
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+        if hasattr(model, '_create_session'):
+            model._create_session()  # ONNX Runtime fija sus hilos al crear la sesión
+        for batch_size in batch_sizes:
+            batch = preprocess_batch(images[:batch_size])
+            real_ai_model._infer_probabilities(model, batch)
+            latencies = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                real_ai_model._infer_probabilities(model, batch)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            stats = _percentiles(latencies)
+            result['runs'].append({
+                'threads': threads,
+                'batch_size': batch_size,
+                'latency_per_batch': stats,
+                'images_per_second': round(batch_size * 1000 / stats['mean_ms'], 2),
+            })
+
+    visit_ms = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        real_ai_model.predict_retinopathy_with_real_ai(images[:visit_size])
+        visit_ms.append((time.perf_counter() - t0) * 1000)
+    result['visit'] = {'images': visit_size, 'threads': torch.get_num_threads(), **_percentiles(visit_ms)}
+
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _available_backends():
+    from real_ai_model import BACKENDS, active_model_path
+
+    available = []
+    for backend in BACKENDS:
+        MODEL_CONFIG['backend'] = backend
+        if backend == 'torch' or os.path.exists(active_model_path()):
+            available.append(backend)
+    MODEL_CONFIG['backend'] = 'torch'
+    return available
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de inferencia por backend')
+    parser.add_argument('--backends', help='Lista separada por comas (por defecto, los que tengan artefacto)')
+    parser.add_argument('--batch-sizes', type=_int_list, default=[1, 4, 8, 16])
+    parser.add_argument('--threads', type=_int_list, default=None, help='Hilos de torch a probar')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--image-size', default='2048x1536', help='Tamaño de la imagen sintética (ancho x alto)')
+    parser.add_argument('--visit-size', type=int, default=6, help='Imágenes por visita para la medición end-to-end')
+    parser.add_argument('--output', help='Archivo JSON de resultados')
+    args = parser.parse_args()
+
+    backends = args.backends.split(',') if args.backends else _available_backends()
+    threads = args.threads or [os.cpu_count() or 1]
+    image_size = tuple(int(v) for v in args.image_size.lower().split('x'))
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': _git_commit(),
+        'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'python': platform.python_version()},
+        'config': {
+            'batch_sizes': args.batch_sizes, 'threads': threads, 'iterations': args.iterations,
+            'image_size': list(image_size), 'visit_size': args.visit_size,
+        },
+        'backends': [],
+    }
+
+    ctx = mp.get_context('spawn')
+    for backend in backends:
+        print(f"⏱️  Midiendo backend {backend}...")
+        with ctx.Pool(1) as pool:
+            try:
+                result = pool.apply(_bench_backend, (backend, args.batch_sizes, threads, args.iterations,
+                                                     image_size, args.visit_size))
+            except Exception as e:
+                print(f"❌ {backend}: {e}")
+                report['backends'].append({'backend': backend, 'error': str(e)})
+                continue
+        report['backends'].append(result)
+        best = max(result['runs'], key=lambda r: r['images_per_second'])
+        print(f"✅ {backend}: arranque {result['cold_start_s']}s, visita p50 {result['visit']['p50_ms']} ms, "
+              f"máx {best['images_per_second']} img/s (lote {best['batch_size']}, {best['threads']} hilos), "
+              f"RSS {result['peak_rss_mb']} MB")
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"📄 Resultados guardados en {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
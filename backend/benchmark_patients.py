@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark de paginación de /api/patients sobre una BD grande.
+
+Crea (o reutiliza) una BD SQLite con N pacientes y mide la latencia de la
+página en distintas profundidades usando el cursor keyset, comparada con la
+misma página pedida con OFFSET. Con keyset la latencia debe ser plana.
+
+Uso:
+    python benchmark_patients.py --patients 500000 --db /tmp/bench_patients.db \\
+        --depths 1,10,100,1000,9000 --output bench_patients.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def _percentiles(samples_ms):
+    samples = np.array(samples_ms)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 2),
+        'p95_ms': round(float(np.percentile(samples, 95)), 2),
+        'mean_ms': round(float(samples.mean()), 2),
+    }
+
+
+def _seed(db, Patient, Diagnosis, patients, diagnoses_per_patient, chunk=20000):
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+    print(f"🗄️ Insertando {patients} pacientes...")
+    for offset in range(0, patients, chunk):
+        rows = [{
+            'id': offset + i + 1,
+            'name': f'Paciente {offset + i + 1}',
+            'age': rng.randint(30, 85),
+            'gender': rng.choice(('Masculino', 'Femenino')),
+            # Varios pacientes por segundo: el cursor también debe desempatar por id
+            'created_at': start + timedelta(seconds=(offset + i) // 3),
+        } for i in range(min(chunk, patients - offset))]
+        db.session.execute(db.insert(Patient), rows)
+        if diagnoses_per_patient:
+            db.session.execute(db.insert(Diagnosis), [
+                {'patient_id': row['id'], 'severity': rng.randint(1, 5), 'confidence': 90.0,
+                 'created_at': row['created_at']}
+                for row in rows for _ in range(diagnoses_per_patient)
+            ])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de paginación de /api/patients')
+    parser.add_argument('--patients', type=int, default=500000)
+    parser.add_argument('--diagnoses-per-patient', type=int, default=1)
+    parser.add_argument('--db', default='bench_patients.db', help='Archivo SQLite (se reutiliza si existe)')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--depths', type=_int_list, default=[1, 10, 100, 1000, 5000],
+                        help='Números de página a medir')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--output', help='Archivo JSON de resultados')
+    args = parser.parse_args()
+
+    # La URL debe fijarse antes de importar la app
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    from app import _encode_cursor, app, db, Patient, Diagnosis
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'host': {'platform': platform.platform(), 'python': platform.python_version()},
+        'config': {'patients': args.patients, 'limit': args.limit, 'iterations': args.iterations},
+        'pages': [],
+    }
+
+    with app.app_context():
+        db.create_all()
+        existing = Patient.query.count()
+        if existing != args.patients:
+            if existing:
+                sys.exit(f"❌ {args.db} ya tiene {existing} pacientes; use otro --db")
+            started = time.perf_counter()
+            _seed(db, Patient, Diagnosis, args.patients, args.diagnoses_per_patient)
+            print(f"✅ BD lista en {time.perf_counter() - started:.1f}s")
+
+        client = app.test_client()
+        ordered = db.session.query(Patient.created_at, Patient.id) \
+            .order_by(Patient.created_at.desc(), Patient.id.desc())
+        for depth in args.depths:
+            offset = (depth - 1) * args.limit
+            if offset >= args.patients:
+                continue
+            # Cursor de la página anterior (sin medir): la última fila antes del offset
+            cursor = ''
+            if offset:
+                last = ordered.offset(offset - 1).limit(1).one()
+                cursor = f'&cursor={_encode_cursor(last.created_at, last.id)}'
+
+            url = f'/api/patients?limit={args.limit}{cursor}'
+            client.get(url)
+            samples = []
+            for _ in range(args.iterations):
+                t0 = time.perf_counter()
+                response = client.get(url)
+                samples.append((time.perf_counter() - t0) * 1000)
+            assert response.status_code == 200, response.get_json()
+            timings = {'keyset': _percentiles(samples)}
+
+            # Referencia: la misma página con OFFSET (lo que haría una paginación ingenua)
+            samples = []
+            for _ in range(args.iterations):
+                t0 = time.perf_counter()
+                ordered.offset(offset).limit(args.limit).all()
+                samples.append((time.perf_counter() - t0) * 1000)
+            timings['offset_query'] = _percentiles(samples)
+
+            report['pages'].append({'page': depth, **timings})
+            print(f"📄 Página {depth}: keyset p50 {timings['keyset']['p50_ms']} ms · "
+                  f"OFFSET (solo consulta) p50 {timings['offset_query']['p50_ms']} ms")
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"📄 Resultados guardados en {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
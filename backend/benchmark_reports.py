@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark de generación de reportes PDF en lote.
+
+Compara el costo por reporte de construir el diseño en cada llamada (como
+hacía create_pdf_report antes de la plantilla precompilada) contra reutilizar
+``REPORT_TEMPLATE``. Los PDF se escriben en un directorio temporal.
+
+Uso:
+    python benchmark_reports.py --reports 300 --images 2 --output bench_reports.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from pdf_report import REPORT_TEMPLATE, ReportTemplate
+from test_resnet50 import create_test_image
+
+PATIENT = {
+    'name': 'Paciente Benchmark', 'age': 61, 'gender': 'Femenino', 'diabetes_years': 12,
+    'diabetes_type': 'tipo_2', 'glucose_level': 182, 'hba1c': 8.4, 'blood_pressure': '140/90',
+    'cholesterol': 210, 'bmi': 29.1, 'vision_right_eye': '20/40', 'vision_left_eye': '20/30',
+    'medications': 'Metformina', 'comorbidities': 'Hipertensión', 'last_eye_exam': 'hace_1_año',
+}
+
+RECOMMENDATIONS = [
+    'Control oftalmológico en 1-2 meses',
+    'Optimizar control glucémico (HbA1c < 7%)',
+    'Control de presión arterial',
+    'Considerar tratamiento láser o anti-VEGF',
+]
+
+
+def _percentiles(samples_ms):
+    samples = np.array(samples_ms)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 2),
+        'p95_ms': round(float(np.percentile(samples, 95)), 2),
+        'mean_ms': round(float(samples.mean()), 2),
+        'total_s': round(float(samples.sum()) / 1000, 2),
+    }
+
+
+def _run(mode, reports, images, out_dir):
+    latencies = []
+    for i in range(reports):
+        diagnosis = {
+            'prediction': 'Retinopatía diabética moderada (NPDR)',
+            'confidence': 80 + i % 20,
+            'severity': i % 5 + 1,
+            'recommendations': RECOMMENDATIONS,
+        }
+        path = os.path.join(out_dir, f'{mode}_{i}.pdf')
+        t0 = time.perf_counter()
+        # 'per_call' reproduce el costo anterior: estilos y bloques fijos en cada reporte
+        template = ReportTemplate() if mode == 'per_call' else REPORT_TEMPLATE
+        template.render(path, PATIENT, images, diagnosis, 'Dr. Benchmark')
+        latencies.append((time.perf_counter() - t0) * 1000)
+        os.remove(path)
+    return _percentiles(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de reportes PDF en lote')
+    parser.add_argument('--reports', type=int, default=300, help='Reportes por modo')
+    parser.add_argument('--images', type=int, default=0, help='Imágenes por reporte')
+    parser.add_argument('--image-size', default='560x420', help='Tamaño de cada imagen (ancho x alto)')
+    parser.add_argument('--output', help='Archivo JSON de resultados')
+    args = parser.parse_args()
+
+    image_size = tuple(int(v) for v in args.image_size.lower().split('x'))
+    images = [create_test_image(image_size, fundus=True, seed=i) for i in range(args.images)]
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'host': {'platform': platform.platform(), 'python': platform.python_version()},
+        'config': {'reports': args.reports, 'images': args.images, 'image_size': list(image_size)},
+        'modes': {},
+    }
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        _run('template', 5, images, out_dir)  # Calentar fuentes y cachés de ReportLab
+        for mode in ('per_call', 'template'):
+            print(f"⏱️  Generando {args.reports} reportes ({mode})...")
+            report['modes'][mode] = _run(mode, args.reports, images, out_dir)
+
+    before, after = report['modes']['per_call']['mean_ms'], report['modes']['template']['mean_ms']
+    report['speedup'] = round(before / after, 2)
+    print(f"✅ Por reporte: {before} ms → {after} ms ({report['speedup']}x)")
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"📄 Resultados guardados en {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Configuración de la base de datos.
+
+``DATABASE_URL`` permite apuntar los mismos modelos a PostgreSQL (requiere
+psycopg2); sin ella se usa SQLite en ``instance/sighttech.db``. Cada conexión
+SQLite nueva se ajusta para varios workers: WAL (lectores y escritor no se
+bloquean), ``synchronous=NORMAL``, mmap, caché de páginas y ``busy_timeout``
+para esperar al escritor en lugar de fallar con "database is locked".
+"""
+
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_URL = 'sqlite:///sighttech.db'
+
+DATABASE_CONFIG = {
+    'busy_timeout_ms': int(os.environ.get('DB_BUSY_TIMEOUT_MS', 30000)),
+    'mmap_size': 256 * 1024 * 1024,   # Bytes de la BD leídos vía mmap
+    'cache_size_kb': 64 * 1024,       # Caché de páginas por conexión
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+    'pool_recycle': 1800,             # Segundos; evita conexiones cortadas por el servidor
+}
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),  # Seguro con WAL: solo se pierde la última transacción si se cae el SO
+    ('busy_timeout', DATABASE_CONFIG['busy_timeout_ms']),
+    ('mmap_size', DATABASE_CONFIG['mmap_size']),
+    ('cache_size', -DATABASE_CONFIG['cache_size_kb']),  # Negativo = KiB
+    ('temp_store', 'MEMORY'),
+)
+
+
+def database_url():
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Heroku/Render publican postgres://, que SQLAlchemy 2 ya no acepta
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _is_memory_sqlite(url):
+    return url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url
+
+
+def engine_options(url):
+    """Opciones de create_engine según el motor"""
+    if _is_memory_sqlite(url):
+        return {}  # Flask-SQLAlchemy usa StaticPool: una sola conexión compartida
+    if url.startswith('sqlite'):
+        return {
+            'pool_size': DATABASE_CONFIG['pool_size'],
+            'max_overflow': DATABASE_CONFIG['max_overflow'],
+            'connect_args': {'timeout': DATABASE_CONFIG['busy_timeout_ms'] / 1000},
+        }
+    return {
+        'pool_size': DATABASE_CONFIG['pool_size'],
+        'max_overflow': DATABASE_CONFIG['max_overflow'],
+        'pool_pre_ping': True,
+        'pool_recycle': DATABASE_CONFIG['pool_recycle'],
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def increment_counters(connection, table, deltas):
+    """Suma ``{clave: (count, total)}`` a una tabla de contadores (key, count, total)
+    con un upsert atómico en la BD, dentro de la transacción de ``connection``"""
+    rows = [{'key': key, 'count': count, 'total': total} for key, (count, total) in deltas.items()]
+    if not rows:
+        return
+
+    dialect_insert = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}.get(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'count': table.c['count'] + stmt.excluded['count'],
+                  'total': table.c.total + stmt.excluded.total}
+        )
+        connection.execute(stmt, rows)
+        return
+
+    # Otros motores: UPDATE y, si la clave no existía, INSERT
+    for row in rows:
+        result = connection.execute(
+            table.update().where(table.c.key == row['key']).values(
+                count=table.c['count'] + row['count'], total=table.c.total + row['total'])
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def lock_for_rewrite(connection, table):
+    """Toma, antes de leer, el candado de escritura de la transacción de ``connection``: nadie más
+    confirma escrituras (en SQLite) o cambios en ``table`` (en otros motores) hasta el commit"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        # pysqlite solo emite BEGIN (diferido) en la primera escritura; si la transacción ya
+        # está abierta, una escritura ajena posterior hace fallar la nuestra (SQLITE_BUSY_SNAPSHOT)
+        # en vez de perderse
+        if not connection.connection.driver_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+    elif dialect == 'postgresql':
+        # EXCLUSIVE permite leer pero espera a (y bloquea) las transacciones que escriben en la tabla
+        connection.exec_driver_sql(f'LOCK TABLE {table.name} IN EXCLUSIVE MODE')
+    else:
+        connection.execute(table.select().with_for_update())
+
+
+def configure_database(app):
+    """Fija la URL y las opciones del engine en la configuración de Flask-SQLAlchemy"""
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    return url
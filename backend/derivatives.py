@@ -0,0 +1,66 @@
+"""
+Derivados reducidos de las imágenes almacenadas.
+
+Cada variante se genera una sola vez por imagen y se guarda junto al
+original (``<sha256>.<variante>.v<N>.<ext>``); como el original es inmutable
+(direccionado por contenido) el derivado nunca queda obsoleto. La escritura es
+atómica, así que dos peticiones simultáneas a lo sumo repiten el trabajo.
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+
+VARIANTS = {
+    # 2.8 × 2.1 pulgadas a ~200 dpi: tamaño al que se dibuja en el reporte PDF
+    'print':   {'size': (560, 420),   'format': 'JPEG', 'quality': 85},
+    # Miniatura y vista previa de /api/diagnosis/<id>/images/<n> (WebP o JPEG según Accept)
+    'thumb':   {'size': (256, 192),   'format': 'JPEG', 'quality': 80},
+    'preview': {'size': (1024, 768),  'format': 'JPEG', 'quality': 85},
+}
+
+# Subir al cambiar tamaños o calidad: cambia los nombres y los ETag de los derivados
+DERIVATIVE_VERSION = 1
+
+_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+
+
+def derivative_path(original_path, variant, image_format=None):
+    image_format = image_format or VARIANTS[variant]['format']
+    stem = os.path.splitext(original_path)[0]
+    return f"{stem}.{variant}.v{DERIVATIVE_VERSION}{_EXTENSIONS[image_format]}"
+
+
+def _render(original_path, spec, image_format, out_path):
+    with Image.open(original_path) as image:
+        # Decodificar JPEG ya a escala reducida (1/2, 1/4, 1/8) cuando alcanza
+        image.draft('RGB', spec['size'])
+        image = image.convert('RGB')
+        image.thumbnail(spec['size'], Image.LANCZOS)
+
+        options = {'quality': spec['quality']} if 'quality' in spec else {}
+        if image_format == 'JPEG':
+            options['optimize'] = True
+        elif image_format == 'WEBP':
+            options['method'] = 4
+        image.save(out_path, format=image_format, **options)
+
+
+def ensure_derivative(original_path, variant='print', image_format=None):
+    """Ruta del derivado (formato de la variante o el indicado); lo genera si aún no existe"""
+    image_format = image_format or VARIANTS[variant]['format']
+    path = derivative_path(original_path, variant, image_format)
+    if os.path.exists(path):
+        return path
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.part')
+    os.close(fd)
+    try:
+        _render(original_path, VARIANTS[variant], image_format, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
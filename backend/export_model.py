@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Exporta el ResNet50-APTOS (.pth) a TorchScript y ONNX para inferencia en CPU.
+
+Uso:
+    python export_model.py --format all
+    python export_model.py --format onnx
+
+Los artefactos se guardan en las rutas de MODEL_PATHS y se seleccionan con
+MODEL_CONFIG['backend'] en model_config.py. La exportación ONNX requiere el
+paquete ``onnx`` además de ``onnxruntime``.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import torch
+
+from model_config import MODEL_CONFIG
+from real_ai_model import load_eager_model, model_path
+
+OPSET_VERSION = 17
+
+
+def _dummy_input(batch_size=1):
+    height, width = MODEL_CONFIG['input_size']
+    return torch.randn(batch_size, 3, height, width)
+
+
+def export_torchscript(model, path):
+    """Traza el modelo y lo congela (pesos como constantes, BatchNorm plegado)"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, _dummy_input())
+        frozen = torch.jit.freeze(traced.eval())
+    frozen.save(path)
+    return path
+
+
+def export_onnx(model, path):
+    """Exporta a ONNX con eje de batch dinámico"""
+    torch.onnx.export(
+        model, (_dummy_input(),), path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=OPSET_VERSION,
+        do_constant_folding=True,
+        dynamo=False
+    )
+    return path
+
+
+def verify_export(model, backend, path, batch_size=4):
+    """Compara las probabilidades del artefacto exportado contra el modelo eager"""
+    batch = _dummy_input(batch_size)
+    with torch.no_grad():
+        expected = torch.softmax(model(batch), dim=1).numpy()
+
+    if backend == 'torchscript':
+        exported = torch.jit.load(path, map_location='cpu')
+        with torch.no_grad():
+            logits = exported(batch)
+    else:
+        import onnxruntime as ort
+        session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        logits = torch.from_numpy(session.run(None, {'input': batch.numpy()})[0])
+
+    actual = torch.softmax(logits, dim=1).numpy()
+    return float(np.abs(expected - actual).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar ResNet50-APTOS a TorchScript/ONNX')
+    parser.add_argument('--format', choices=['torchscript', 'onnx', 'all'], default='all')
+    args = parser.parse_args()
+
+    model = load_eager_model()
+    backends = ['torchscript', 'onnx'] if args.format == 'all' else [args.format]
+    exporters = {'torchscript': export_torchscript, 'onnx': export_onnx}
+
+    for backend in backends:
+        path = model_path(f"{MODEL_CONFIG['model_type']}_{backend}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"📦 Exportando {backend} → {path}")
+        exporters[backend](model, path)
+        drift = verify_export(model, backend, path)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"✅ {backend}: {size_mb:.1f} MB, diferencia máxima de probabilidad {drift:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,23 @@
 """
 Script para generar datos de demostración realistas para SightTech
 Genera pacientes y diagnósticos con datos médicos plausibles
+
+También sirve para cargas de prueba: inserta por bloques, así que llega a
+millones de filas en minutos. Ejemplos:
+    python generate_demo_data.py                               # 25 pacientes, BD nueva
+    python generate_demo_data.py --patients 1000000 --diagnoses-per-patient 3 \\
+        --seed 42 --until 2026-01-01T00:00:00                  # Reproducible
+    python generate_demo_data.py --patients 10000 --append     # Sin borrar lo existente
 """
 
+import argparse
 import random
 import json
+import time
 from datetime import datetime, timedelta
-from app import app, db, Patient, Diagnosis
+from app import (app, db, diagnosis_detail_rows, diagnosis_stats, insert_detail_rows,
+                 normalize_patient_name, reconcile_stats, visit_snapshot, DashboardStat, Patient, Diagnosis)
+from database import increment_counters
 
 # Nombres realistas para pacientes
 NOMBRES_MASCULINOS = [
@@ -52,63 +63,79 @@ COMORBILIDADES = [
     "Ninguna"
 ]
 
-def generar_paciente():
-    """Genera un paciente con datos médicos realistas"""
+# Clínicas ficticias: los pacientes de demo nunca coinciden con altas reales (clínica vacía)
+CLINICAS = ["Clínica Demo Norte", "Clínica Demo Sur", "Clínica Demo Centro", "Hospital Demo"]
+
+# Valores del formulario de análisis (app_analysis.html)
+SINTOMAS = ["vision_borrosa", "vision_nocturna", "manchas_negras", "vision_colores",
+            "perdida_vision", "vision_periferica", "dolor_ojos"]
+FACTORES_RIESGO = ["hipertension", "historial_familiar", "colesterol_alto", "embarazo",
+                   "tabaquismo", "sedentarismo", "obesidad"]
+
+RECOMENDACIONES = [
+    "Control estricto de la glucosa en sangre",
+    "Revisiones oftalmológicas regulares",
+    "Mantener presión arterial controlada"
+]
+RECOMENDACIONES_JSON = json.dumps(RECOMENDACIONES)
+
+def generar_paciente(rng=random):
+    """Genera un paciente con datos médicos realistas (``rng``: generador para reproducir datos)"""
     
     # Género y nombre
-    genero = random.choice(["Masculino", "Femenino"])
+    genero = rng.choice(["Masculino", "Femenino"])
     if genero == "Masculino":
-        nombre = random.choice(NOMBRES_MASCULINOS)
+        nombre = rng.choice(NOMBRES_MASCULINOS)
     else:
-        nombre = random.choice(NOMBRES_FEMENINOS)
+        nombre = rng.choice(NOMBRES_FEMENINOS)
     
     # Edad (mayormente adultos mayores con diabetes)
-    edad = random.randint(45, 75)
+    edad = rng.randint(45, 75)
     
     # Años con diabetes (correlacionado con edad)
-    anos_diabetes = random.randint(1, min(edad - 20, 25))
+    anos_diabetes = rng.randint(1, min(edad - 20, 25))
     
     # Tipo de diabetes (mayormente tipo 2)
-    tipo_diabetes = random.choices(
+    tipo_diabetes = rng.choices(
         ["tipo_1", "tipo_2", "gestacional", "prediabetes"],
         weights=[0.15, 0.7, 0.1, 0.05]
     )[0]
     
     # Glucosa (correlacionada con control)
-    glucosa = random.randint(120, 280)
+    glucosa = rng.randint(120, 280)
     
     # HbA1c (correlacionada con glucosa)
-    hba1c = round(random.uniform(6.0, 12.0), 1)
+    hba1c = round(rng.uniform(6.0, 12.0), 1)
     
     # Presión arterial
-    sistolica = random.randint(110, 180)
-    diastolica = random.randint(70, 110)
+    sistolica = rng.randint(110, 180)
+    diastolica = rng.randint(70, 110)
     presion = f"{sistolica}/{diastolica}"
     
     # Colesterol
-    colesterol = random.randint(150, 350)
+    colesterol = rng.randint(150, 350)
     
     # IMC
-    imc = round(random.uniform(22.0, 38.0), 1)
+    imc = round(rng.uniform(22.0, 38.0), 1)
     
     # Capacidad visual (correlacionada con severidad)
-    vision_od = random.choice(["20/20", "20/25", "20/30", "20/40", "20/50", "20/60", "20/70", "20/80"])
-    vision_oi = random.choice(["20/20", "20/25", "20/30", "20/40", "20/50", "20/60", "20/70", "20/80"])
+    vision_od = rng.choice(["20/20", "20/25", "20/30", "20/40", "20/50", "20/60", "20/70", "20/80"])
+    vision_oi = rng.choice(["20/20", "20/25", "20/30", "20/40", "20/50", "20/60", "20/70", "20/80"])
     
     # Medicamentos
-    medicamentos = random.choice(MEDICAMENTOS)
+    medicamentos = rng.choice(MEDICAMENTOS)
     
     # Comorbilidades
-    comorbilidades = random.choice(COMORBILIDADES)
+    comorbilidades = rng.choice(COMORBILIDADES)
     
     # Último examen ocular
-    ultimo_examen = random.choices(
+    ultimo_examen = rng.choices(
         ["menos_6_meses", "6_12_meses", "1_2_anos", "mas_2_anos", "nunca"],
         weights=[0.3, 0.4, 0.2, 0.08, 0.02]
     )[0]
     
     # Diagnóstico previo
-    diagnostico_previo = random.choices(
+    diagnostico_previo = rng.choices(
         ["ninguno", "leve", "moderado", "severo", "proliferativo"],
         weights=[0.4, 0.3, 0.2, 0.08, 0.02]
     )[0]
@@ -132,7 +159,7 @@ def generar_paciente():
         "previous_diagnosis": diagnostico_previo
     }
 
-def generar_diagnostico(paciente):
+def generar_diagnostico(paciente, rng=random):
     """Genera un diagnóstico basado en los datos del paciente"""
     
     # Calcular riesgo basado en datos del paciente
@@ -161,23 +188,23 @@ def generar_diagnostico(paciente):
     if riesgo >= 8:
         diagnostico = "Retinopatía diabética proliferativa (PDR)"
         severidad = 4
-        confianza = random.uniform(85, 95)
+        confianza = rng.uniform(85, 95)
     elif riesgo >= 6:
         diagnostico = "Retinopatía diabética severa (NPDR)"
         severidad = 3
-        confianza = random.uniform(80, 90)
+        confianza = rng.uniform(80, 90)
     elif riesgo >= 4:
         diagnostico = "Retinopatía diabética moderada (NPDR)"
         severidad = 2
-        confianza = random.uniform(75, 85)
+        confianza = rng.uniform(75, 85)
     elif riesgo >= 2:
         diagnostico = "Retinopatía diabética leve (NPDR)"
         severidad = 1
-        confianza = random.uniform(70, 80)
+        confianza = rng.uniform(70, 80)
     else:
         diagnostico = "Sin retinopatía diabética"
         severidad = 0
-        confianza = random.uniform(85, 95)
+        confianza = rng.uniform(85, 95)
     
     return {
         "prediction": diagnostico,
@@ -185,91 +212,169 @@ def generar_diagnostico(paciente):
         "severity": severidad
     }
 
-def generar_datos_demo(num_pacientes=20):
-    """Genera datos de demostración completos"""
-    
+def generar_visita(paciente, rng=random):
+    """Síntomas e historial médico con la misma forma que envía el formulario de análisis"""
+    sintomas = rng.sample(SINTOMAS, rng.choices((0, 1, 2, 3), weights=(0.3, 0.35, 0.25, 0.1))[0])
+    factores = rng.sample(FACTORES_RIESGO, rng.choices((0, 1, 2, 3), weights=(0.25, 0.35, 0.25, 0.15))[0])
+    historial = {
+        "risk_factors": factores,
+        "diabetes_type": paciente["diabetes_type"],
+        "hba1c": paciente["hba1c"],
+        "medications": paciente["medications"],
+        "comorbidities": paciente["comorbidities"],
+        "last_eye_exam": paciente["last_eye_exam"],
+        "previous_diagnosis": paciente["previous_diagnosis"],
+    }
+    return {"symptoms": sintomas}, historial
+
+def _rango_diagnosticos(valor):
+    """'3' -> (3, 3); '1-5' -> (1, 5)"""
+    minimo, _, maximo = str(valor).partition('-')
+    return int(minimo), int(maximo or minimo)
+
+def generar_datos_demo(num_pacientes=20, diagnosticos_por_paciente=(1, 3), seed=None, append=False,
+                       chunk_size=5000, dias=180, hasta=None, verbose=None):
+    """Genera datos de demostración con inserciones masivas (Core ``insert()`` por bloques).
+
+    Con el mismo ``seed`` (y ``hasta``) se obtienen exactamente los mismos datos.
+    ``append=True`` agrega sobre la BD existente; si no, la reinicia con ``drop_all()``.
+    Devuelve (pacientes_creados, diagnosticos_creados).
+    """
+    rng = random.Random(seed)
+    hasta = hasta or datetime.utcnow()
+    min_diag, max_diag = diagnosticos_por_paciente
+    if verbose is None:
+        verbose = num_pacientes <= 50  # Detalle por paciente solo en cargas pequeñas
+
     with app.app_context():
-        # Inicializar base de datos
-        print("🗄️ Inicializando base de datos...")
-        db.drop_all()
-        db.create_all()
-        print("✅ Base de datos inicializada")
-        
-        print(f"🎯 Generando {num_pacientes} pacientes de demostración...")
-        
-        pacientes_creados = []
-        
-        for i in range(num_pacientes):
-            # Generar paciente
-            datos_paciente = generar_paciente()
-            
-            # Crear paciente en BD
-            paciente = Patient(**datos_paciente)
-            db.session.add(paciente)
-            db.session.commit()
-            
-            # Generar 1-3 diagnósticos por paciente
-            num_diagnosticos = random.randint(1, 3)
-            
-            for j in range(num_diagnosticos):
-                # Generar diagnóstico
-                datos_diagnostico = generar_diagnostico(datos_paciente)
-                
-                # Fecha del diagnóstico (últimos 6 meses)
-                fecha = datetime.now() - timedelta(
-                    days=random.randint(0, 180),
-                    hours=random.randint(0, 23),
-                    minutes=random.randint(0, 59)
-                )
-                
-                # Crear diagnóstico
-                diagnostico = Diagnosis(
-                    patient_id=paciente.id,
-                    image_paths=json.dumps([f"demo_image_{i}_{j}.jpg"]),
-                    prediction=datos_diagnostico["prediction"],
-                    confidence=datos_diagnostico["confidence"],
-                    severity=datos_diagnostico["severity"],
-                    recommendations=json.dumps([
-                        "Control estricto de la glucosa en sangre",
-                        "Revisiones oftalmológicas regulares",
-                        "Mantener presión arterial controlada"
-                    ]),
-                    symptoms=json.dumps(["vision_borrosa", "manchas_negras"]),
-                    medical_history=json.dumps(datos_paciente),
-                    created_at=fecha
-                )
-                
-                db.session.add(diagnostico)
-            
+        if append:
+            db.create_all()
+        else:
+            print("🗄️ Inicializando base de datos...")
+            db.drop_all()
+            db.create_all()
+            print("✅ Base de datos inicializada")
+
+        # BD con datos pero sin contadores (anterior a dashboard_stat): partir de valores correctos
+        if append and DashboardStat.query.first() is None and Patient.query.first() is not None:
+            reconcile_stats()
+
+        print(f"🎯 Generando {num_pacientes} pacientes de demostración "
+              f"({'agregando' if append else 'BD nueva'}, seed={seed})...")
+        started = time.perf_counter()
+        # Sobre las tablas (no los modelos): executemany de Core, sin la contabilidad del ORM
+        patient_table, diagnosis_table = Patient.__table__, Diagnosis.__table__
+        insert_patients = patient_table.insert().returning(patient_table.c.id, sort_by_parameter_order=True)
+        insert_diagnoses = diagnosis_table.insert().returning(diagnosis_table.c.id, sort_by_parameter_order=True)
+        pacientes_creados = diagnosticos_creados = 0
+
+        for offset in range(0, num_pacientes, chunk_size):
+            pacientes, visitas = [], []
+            for i in range(offset, min(offset + chunk_size, num_pacientes)):
+                datos = generar_paciente(rng)
+                alta = hasta - timedelta(seconds=rng.randint(0, dias * 86400))
+                pacientes.append({
+                    **datos,
+                    "name_key": normalize_patient_name(datos["name"]),
+                    "birth_year": alta.year - datos["age"],
+                    "clinic": rng.choice(CLINICAS),
+                    "created_at": alta,
+                })
+                visitas.append((datos, json.dumps(visit_snapshot(datos)), alta, rng.randint(min_diag, max_diag)))
+
+            # Los ids los asigna la BD (también en modo append); RETURNING los trae en orden
+            ids = db.session.execute(insert_patients, pacientes).scalars().all()
+
+            diagnosticos, visitas_diagnostico, detalles = [], [], {}
+            for patient_id, (datos, snapshot, alta, num_diagnosticos) in zip(ids, visitas):
+                for j in range(num_diagnosticos):
+                    resultado = generar_diagnostico(datos, rng)
+                    sintomas, historial = generar_visita(datos, rng)
+                    fecha = alta + (hasta - alta) * rng.random()
+                    imagenes = [f"demo_image_{patient_id}_{j}.jpg"]
+                    diagnosticos.append({
+                        "patient_id": patient_id,
+                        "image_paths": json.dumps(imagenes),
+                        "prediction": resultado["prediction"],
+                        "confidence": resultado["confidence"],
+                        "severity": resultado["severity"],
+                        "recommendations": RECOMENDACIONES_JSON,
+                        "symptoms": json.dumps(sintomas),
+                        "medical_history": json.dumps(historial),
+                        "physician_name": "SightTech",
+                        "patient_snapshot": snapshot,
+                        "details_indexed": True,
+                        "created_at": fecha,
+                    })
+                    visitas_diagnostico.append((sintomas, historial, imagenes))
+            if diagnosticos:
+                diagnostico_ids = db.session.execute(insert_diagnoses, diagnosticos).scalars().all()
+                # Síntomas, factores de riesgo, recomendaciones e imágenes en sus tablas normalizadas
+                for diagnosis_id, (sintomas, historial, imagenes) in zip(diagnostico_ids, visitas_diagnostico):
+                    filas = diagnosis_detail_rows(diagnosis_id, sintomas, historial, RECOMENDACIONES, imagenes)
+                    for tabla, filas_tabla in filas.items():
+                        detalles.setdefault(tabla, []).extend(filas_tabla)
+                insert_detail_rows(detalles)
+
+            # Las inserciones Core no pasan por after_flush: los contadores del dashboard se
+            # incrementan aquí, en la misma transacción del bloque
+            contadores = {'patients': (len(pacientes), 0.0), 'diagnoses': (len(diagnosticos), 0.0)}
+            for fila in diagnosticos:
+                for clave, count, total in diagnosis_stats(fila["severity"], fila["confidence"], fila["created_at"]):
+                    old_count, old_total = contadores.get(clave, (0, 0.0))
+                    contadores[clave] = (old_count + count, old_total + total)
+            increment_counters(db.session.connection(), DashboardStat.__table__, contadores)
             db.session.commit()
-            pacientes_creados.append(paciente)
-            
-            print(f"✅ Paciente {i+1}/{num_pacientes}: {paciente.name} ({paciente.age} años)")
-        
-        print(f"\n🎉 ¡Datos de demostración generados exitosamente!")
-        print(f"📊 Total de pacientes: {len(pacientes_creados)}")
-        
-        # Mostrar estadísticas
-        total_diagnosticos = Diagnosis.query.count()
-        print(f"📋 Total de diagnósticos: {total_diagnosticos}")
-        
-        # Distribución por severidad
-        for i in range(5):
-            count = Diagnosis.query.filter_by(severity=i).count()
-            print(f"   Nivel {i}: {count} diagnósticos")
-        
-        return pacientes_creados
 
-if __name__ == "__main__":
+            pacientes_creados += len(pacientes)
+            diagnosticos_creados += len(diagnosticos)
+            if verbose:
+                for fila in pacientes:
+                    print(f"✅ Paciente: {fila['name']} ({fila['age']} años)")
+            else:
+                elapsed = time.perf_counter() - started
+                print(f"   {pacientes_creados}/{num_pacientes} pacientes · {diagnosticos_creados} diagnósticos "
+                      f"· {pacientes_creados / elapsed:.0f} pacientes/s")
+
+
+        print(f"\n🎉 ¡Datos de demostración generados en {time.perf_counter() - started:.1f}s!")
+        print(f"📊 Pacientes creados: {pacientes_creados}")
+        print(f"📋 Diagnósticos creados: {diagnosticos_creados}")
+
+        # Distribución por severidad (una sola consulta agrupada)
+        for severidad, count in db.session.query(Diagnosis.severity, db.func.count(Diagnosis.id)) \
+                .group_by(Diagnosis.severity).order_by(Diagnosis.severity):
+            print(f"   Nivel {severidad}: {count} diagnósticos")
+
+        return pacientes_creados, diagnosticos_creados
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera datos de demostración / carga para SightTech')
+    parser.add_argument('--patients', type=int, default=25)
+    parser.add_argument('--diagnoses-per-patient', type=_rango_diagnosticos, default=(1, 3),
+                        help="Fijo ('3') o rango ('1-5')")
+    parser.add_argument('--seed', type=int, default=None, help='Semilla para reproducir los mismos datos')
+    parser.add_argument('--until', type=datetime.fromisoformat, default=None,
+                        help='Fecha más reciente (ISO, UTC); fijarla junto con --seed para datos idénticos')
+    parser.add_argument('--days', type=int, default=180, help='Antigüedad máxima de los datos')
+    parser.add_argument('--append', action='store_true', help='Agregar a la BD existente en lugar de reiniciarla')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Pacientes por inserción masiva')
+    args = parser.parse_args()
+
     print("🚀 Iniciando generación de datos de demostración...")
     print("=" * 50)
-    
+
     try:
-        pacientes = generar_datos_demo(25)  # Generar 25 pacientes
+        generar_datos_demo(args.patients, diagnosticos_por_paciente=args.diagnoses_per_patient,
+                           seed=args.seed, append=args.append, chunk_size=args.chunk_size,
+                           dias=args.days, hasta=args.until)
         print("\n✅ ¡Proceso completado exitosamente!")
         print("🌐 Puedes acceder al dashboard para ver los datos generados.")
-        
+
     except Exception as e:
         print(f"❌ Error generando datos: {e}")
         import traceback
-        traceback.print_exc() 
\ No newline at end of file
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Pool de procesos de inferencia con pesos compartidos.
+
+Los workers se crean con ``forkserver``: un proceso servidor de un solo hilo,
+arrancado limpio (exec) e independiente de los hilos de Flask, importa los
+módulos de ``preload`` —que cargan el modelo— y hace fork de cada worker. Así
+los tensores de pesos quedan compartidos copy-on-write (solo se leen) y ningún
+fork hereda candados tomados por otros hilos del proceso web, tampoco los
+reinicios que pide el hilo de salud. Cada worker limita sus hilos de torch
+para no sobresuscribir los núcleos físicos; el hilo de salud reinicia los que
+mueran, reenviando sus lotes pendientes.
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+def physical_cores():
+    """Núcleos físicos disponibles (psutil si está instalado; si no, CPUs asignadas)"""
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+    except ImportError:
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def restart_forkserver():
+    """Detiene el forkserver: el próximo pool arranca uno nuevo que vuelve a importar su
+    ``preload`` (p. ej. tras cambiar los pesos). Solo con los pools anteriores ya cerrados,
+    porque sus workers informan su salida a través de él"""
+    from multiprocessing import forkserver
+    forkserver._forkserver._stop()
+
+
+def _worker_main(load_model, model_id, infer_fn, tasks, results, num_threads):
+    import torch
+    torch.set_num_threads(num_threads)
+
+    # Ya cargado en el forkserver (compartido); load_model lo recarga si no es model_id
+    try:
+        model, load_error = load_model(model_id), None
+    except Exception as e:
+        model, load_error = None, f"No se pudo cargar el modelo: {type(e).__name__}: {e}"
+
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        task_id, batch = item
+        if load_error:
+            results.put((task_id, None, load_error))
+            continue
+        try:
+            results.put((task_id, infer_fn(model, batch), None))
+        except Exception as e:
+            results.put((task_id, None, f"{type(e).__name__}: {e}"))
+
+
+class _Task:
+    __slots__ = ('batch', 'future', 'attempts')
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.future = Future()
+        self.attempts = 0
+
+
+class InferencePool:
+    """N procesos que ejecutan ``infer_fn(model, batch)`` con ``model = load_model(model_id)``
+
+    ``load_model`` e ``infer_fn`` deben ser funciones de módulo (se envían por pickle) y
+    ``preload`` los módulos que el forkserver importa una vez antes de crear workers.
+    """
+
+    def __init__(self, load_model, infer_fn, model_id=None, preload=None, workers=None,
+                 threads_per_worker=None, health_check_seconds=5.0, max_retries=1, task_timeout=120.0):
+        cores = physical_cores()
+        self.load_model = load_model
+        self.model_id = model_id
+        self.infer_fn = infer_fn
+        self.size = max(1, int(workers or cores))
+        self.threads_per_worker = max(1, int(threads_per_worker or cores // self.size))
+        self.health_check_seconds = health_check_seconds
+        self.max_retries = max_retries
+        self.task_timeout = task_timeout
+
+        self._ctx = mp.get_context('forkserver')
+        if preload:
+            # Solo surte efecto si el forkserver aún no arrancó (primer pool o restart_forkserver)
+            self._ctx.set_forkserver_preload(list(preload))
+        self._results = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._workers = [None] * self.size
+        self._queues = [None] * self.size
+        self._in_flight = [dict() for _ in range(self.size)]
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+        self._closed = False
+
+        with self._lock:
+            for idx in range(self.size):
+                self._start_worker(idx)
+
+        self._collector = threading.Thread(target=self._collect_results, name='inference-pool-results',
+                                           daemon=True)
+        self._collector.start()
+        threading.Thread(target=self._health_check, name='inference-pool-health', daemon=True).start()
+        print(f"🧵 Pool de inferencia: {self.size} procesos × {self.threads_per_worker} hilos")
+
+    def _start_worker(self, idx):
+        """Crea cola y proceso del worker ``idx``; se llama con ``self._lock`` tomado para que
+        ningún _dispatch encole en la cola de un worker muerto"""
+        queue = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(self.load_model, self.model_id, self.infer_fn, queue, self._results,
+                  self.threads_per_worker),
+            name=f'inference-worker-{idx}',
+            daemon=True
+        )
+        proc.start()
+        self._queues[idx], self._workers[idx] = queue, proc
+        self._in_flight[idx] = {}
+
+    def _dispatch(self, task_id, task, idx=None):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pool de inferencia cerrado")
+            if idx is None:
+                idx = min(range(self.size), key=lambda i: len(self._in_flight[i]))
+            task.attempts += 1
+            self._in_flight[idx][task_id] = task
+            self._queues[idx].put((task_id, task.batch))
+
+    def _submit(self, batch, worker=None):
+        task_id, task = next(self._ids), _Task(batch)
+        self._dispatch(task_id, task, worker)
+        return task_id, task
+
+    def submit(self, batch, worker=None):
+        """Encola un lote (ndarray) y devuelve un Future con la salida de infer_fn"""
+        return self._submit(batch, worker)[1].future
+
+    def _wait(self, task_id, task):
+        """Resultado del lote; tras ``task_timeout`` segundos lo retira del pool y falla su Future"""
+        try:
+            return task.future.result(timeout=self.task_timeout)
+        except FutureTimeout:
+            with self._lock:
+                pending = any(in_flight.pop(task_id, None) is not None for in_flight in self._in_flight)
+                if pending:
+                    self._failed += 1
+            if pending:
+                task.future.set_exception(
+                    RuntimeError(f"Lote de inferencia sin respuesta tras {self.task_timeout}s"))
+            # Si el resultado llegó justo al vencer el plazo (o el lote se está reenviando tras
+            # reiniciar su worker), se espera un plazo más
+            return task.future.result(timeout=self.task_timeout)
+
+    def run(self, batch):
+        return self._wait(*self._submit(batch))
+
+    def broadcast(self, batch):
+        """Ejecuta el mismo lote en todos los workers (calentamiento)"""
+        tasks = [self._submit(batch, worker=idx) for idx in range(self.size)]
+        return [self._wait(task_id, task) for task_id, task in tasks]
+
+    def _collect_results(self):
+        while True:
+            item = self._results.get()
+            if item is None:  # close()
+                break
+            task_id, output, error = item
+            with self._lock:
+                task = None
+                for in_flight in self._in_flight:
+                    task = in_flight.pop(task_id, None)
+                    if task is not None:
+                        break
+                if task is None:
+                    continue
+                if error is None:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            if error is None:
+                task.future.set_result(output)
+            else:
+                task.future.set_exception(RuntimeError(error))
+
+    def _health_check(self):
+        while not self._closed:
+            time.sleep(self.health_check_seconds)
+            for idx, proc in enumerate(self._workers):
+                if proc.is_alive() or self._closed:
+                    continue
+                print(f"⚠️ Worker de inferencia {idx} terminó (exitcode {proc.exitcode}), reiniciando...")
+                with self._lock:
+                    if self._closed:
+                        break
+                    orphaned = self._in_flight[idx]
+                    self._restarts += 1
+                    self._start_worker(idx)
+                for task_id, task in orphaned.items():
+                    if task.attempts <= self.max_retries:
+                        try:
+                            self._dispatch(task_id, task)
+                        except RuntimeError as e:  # Pool cerrado entretanto
+                            task.future.set_exception(e)
+                    else:
+                        with self._lock:
+                            self._failed += 1
+                        task.future.set_exception(RuntimeError(f"Worker de inferencia {idx} terminó"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.size,
+                'threads_per_worker': self.threads_per_worker,
+                'alive': sum(1 for p in self._workers if p.is_alive()),
+                'in_flight': sum(len(f) for f in self._in_flight),
+                'completed': self._completed,
+                'failed': self._failed,
+                'restarts': self._restarts,
+            }
+
+    def close(self):
+        """Detiene los workers cuando terminan sus lotes encolados; falla los que queden sin respuesta"""
+        with self._lock:
+            self._closed = True
+        for idx, proc in enumerate(self._workers):
+            if proc.is_alive():
+                self._queues[idx].put(None)
+        for proc in self._workers:
+            proc.join()
+        self._results.put(None)
+        self._collector.join(timeout=5)
+        with self._lock:
+            orphaned = [task for in_flight in self._in_flight for task in in_flight.values()]
+            self._in_flight = [dict() for _ in range(self.size)]
+            self._failed += len(orphaned)
+        for task in orphaned:
+            task.future.set_exception(RuntimeError("Pool de inferencia cerrado"))
@@ -0,0 +1,17 @@
+"""
+Módulo que importa el forkserver del pool de inferencia (``set_forkserver_preload``).
+
+Carga el modelo una sola vez en ese proceso; los workers se crean por fork
+desde él y comparten los pesos copy-on-write. Si la carga falla el forkserver
+debe seguir vivo: cada worker lo reintenta por su cuenta y reporta el error.
+Si cambia el archivo de pesos, real_ai_model reinicia el forkserver y este
+módulo se vuelve a importar con los pesos nuevos.
+El forkserver lo importa desde el directorio de trabajo (``cd backend``, como
+en start.sh); si no lo encuentra, cada worker carga su propia copia.
+"""
+
+try:
+    from real_ai_model import _load_model
+    _load_model()
+except Exception as e:
+    print(f"⚠️ Forkserver de inferencia sin modelo precargado: {e}")
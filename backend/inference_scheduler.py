@@ -0,0 +1,119 @@
+"""
+Planificador de inferencia con micro-batching dinámico entre peticiones.
+
+Las imágenes de peticiones concurrentes a /api/analyze se encolan y los hilos
+del planificador las agrupan en lotes compartidos (hasta ``max_batch_size``
+imágenes o ``max_wait_ms`` de espera) antes de llamar al modelo.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class _PendingImage:
+    __slots__ = ('tensor', 'future', 'enqueued_at')
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    """Agrupa imágenes de varias peticiones en forward passes compartidos"""
+
+    def __init__(self, forward_fn, max_batch_size=16, max_wait_ms=5.0, stats_window=1000, concurrency=1):
+        # forward_fn recibe una lista de tensores y devuelve una probabilidad por tensor;
+        # concurrency > 1 permite tener varios lotes en vuelo (p. ej. un pool de procesos)
+        self.forward_fn = forward_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = {}
+        self._waits_ms = deque(maxlen=stats_window)
+        self._batches = 0
+        self._images = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f'inference-scheduler-{i}', daemon=True)
+            for i in range(max(1, int(concurrency)))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, tensors):
+        """Encola los tensores de una petición y bloquea hasta tener sus probabilidades"""
+        pending = [_PendingImage(t) for t in tensors]
+        for item in pending:
+            self._queue.put(item)
+        depth = self._queue.qsize()
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return [item.future.result() for item in pending]
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            try:
+                results = self.forward_fn([item.tensor for item in batch])
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+
+            with self._lock:
+                self._batches += 1
+                self._images += len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._waits_ms.extend((started - item.enqueued_at) * 1000 for item in batch)
+
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
+
+    def stats(self):
+        """Estadísticas de profundidad de cola, tamaño de lote y espera en cola"""
+        with self._lock:
+            waits = sorted(self._waits_ms)
+
+            def percentile(p):
+                if not waits:
+                    return 0.0
+                return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))], 2)
+
+            return {
+                'concurrency': len(self._threads),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'batches': self._batches,
+                'images': self._images,
+                'errors': self._errors,
+                'avg_batch_size': round(self._images / self._batches, 2) if self._batches else 0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'queue_wait_ms': {'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99)},
+            }
@@ -5,10 +5,36 @@ Configuración del modelo de IA para retinopatía diabética
 # Configuración del modelo
 MODEL_CONFIG = {
     'model_type': 'resnet50',  # Tipo de modelo a usar
+    'backend': 'torch',        # Motor de inferencia: 'torch', 'torchscript', 'onnx' o 'int8' (ver export_model.py / quantize_model.py)
     'input_size': (224, 224),  # Tamaño de entrada de las imágenes
-    'batch_size': 1,           # Tamaño del batch para predicción
+    'batch_size': 8,           # Imágenes por forward pass (una visita típica cabe en un solo lote)
     'use_gpu': True,           # Usar GPU si está disponible
     'confidence_threshold': 0.7,  # Umbral de confianza mínimo
+    'warmup_passes': 2,        # Forward passes de calentamiento al arrancar
+}
+
+# Micro-batching entre peticiones concurrentes (ver inference_scheduler.py)
+SCHEDULER_CONFIG = {
+    'enabled': True,
+    'max_batch_size': 16,      # Máximo de imágenes por forward pass compartido
+    'max_wait_ms': 5,          # Espera máxima para completar un lote (latencia vs. throughput)
+}
+
+# Pool de procesos de inferencia con pesos compartidos vía forkserver (ver inference_pool.py)
+POOL_CONFIG = {
+    'enabled': True,
+    'workers': None,               # None = un proceso por núcleo físico
+    'threads_per_worker': None,    # None = núcleos físicos / workers (sin sobresuscripción)
+    'health_check_seconds': 5,     # Intervalo para detectar y reiniciar workers caídos
+    'max_retries': 1,              # Reintentos de un lote cuyo worker murió
+    'task_timeout_seconds': 120,   # Espera máxima por un lote antes de fallar la petición
+}
+
+# Caché de predicciones por hash de píxeles + modelo (ver prediction_cache.py)
+PREDICTION_CACHE_CONFIG = {
+    'enabled': True,
+    'max_entries': 512,        # Entradas LRU (una por conjunto de imágenes)
+    'persist_dir': None,       # Carpeta para persistir la caché entre reinicios (None = solo memoria)
 }
 
 # Clases de retinopatía
@@ -34,7 +60,11 @@ PREPROCESSING_CONFIG = {
     'normalize': True,
     'augment': False,
     'resize_method': 'bilinear',
-    'color_mode': 'rgb'
+    'color_mode': 'rgb',
+    'crop_black_border': True,  # Recortar el fondo negro alrededor del círculo de la retina
+    'border_threshold': 10,     # Intensidad máxima (0-255) considerada fondo
+    'draft_margin': 2,          # Decodificar JPEG a >= input_size × margen (antes del recorte)
+    'workers': 4,               # Hilos para preprocesar en paralelo las imágenes de un lote
 }
 
 # Rutas de modelos (para futuras implementaciones)
@@ -42,7 +72,12 @@ MODEL_PATHS = {
     'resnet50': 'models/resnet50_retinopathy.h5',
     'densenet121': 'models/densenet121_retinopathy.h5',
     'efficientnet': 'models/efficientnet_retinopathy.h5',
-    'custom': 'models/custom_retinopathy.h5'
+    'custom': 'models/custom_retinopathy.h5',
+    # Exportaciones del ResNet50-APTOS para inferencia en CPU (python export_model.py)
+    'resnet50_torchscript': 'models/resnet50_aptos_torchscript.pt',
+    'resnet50_onnx': 'models/resnet50_aptos.onnx',
+    # Variante INT8 calibrada con imágenes de fondo de ojo (python quantize_model.py quantize)
+    'resnet50_int8': 'models/resnet50_aptos_int8.pt',
 }
 
 # Configuración de logging
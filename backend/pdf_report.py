@@ -0,0 +1,311 @@
+"""
+Plantilla del reporte PDF de retinopatía diabética.
+
+Los estilos de ReportLab, los mapas de color, los estilos de las tablas (incluida
+la escala ICDRD por nivel de severidad) y los bloques fijos (marca, firma,
+nota clínica) se construyen una sola vez al importar el módulo en
+``REPORT_TEMPLATE``; cada reporte solo vincula los datos del diagnóstico.
+"""
+
+import copy
+import io
+import tempfile
+from datetime import datetime
+
+from PIL import Image
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import HRFlowable, Image as RLImage, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from derivatives import VARIANTS, ensure_derivative
+
+SEV_COLORS  = {1:'#10b981', 2:'#3b82f6', 3:'#f59e0b', 4:'#ef4444', 5:'#dc2626'}
+SEV_LABELS  = ['Sin RD', 'Leve', 'Moderada', 'Severa', 'Proliferativa']
+NEXT_REVIEW = {1:'6-12 meses', 2:'3-6 meses', 3:'1-2 meses', 4:'2-4 semanas', 5:'1-2 semanas'}
+PROG_RISK   = ['Bajo', 'Moderado', 'Alto', 'Muy alto', 'Crítico']
+URGENCY     = {4:'Consulta URGENTE (24-48h)', 5:'Consulta URGENTE (24-48h)'}
+
+# Etiquetas fijas de las tablas de datos (se parsean una sola vez)
+INFO_LABELS = (
+    'Nombre', 'Edad', 'Género', 'Años con diabetes', 'Tipo de diabetes', 'Visión OD', 'Visión OI',
+    'Medicamentos', 'Comorbilidades', 'Glucosa', 'HbA1c', 'Presión arterial', 'Colesterol', 'IMC',
+    'Último exam. ocular', 'Diagnóstico previo', 'Urgencia', 'Próxima revisión',
+    'Riesgo de progresión', 'Tratamiento indicado',
+)
+
+
+def _print_source(image):
+    """Imagen a resolución de impresión: derivado cacheado si es una ruta, copia reducida si es PIL"""
+    if isinstance(image, str):
+        # El JPEG del derivado se incrusta tal cual, sin volver a codificarlo
+        return ensure_derivative(image, 'print')
+    spec = VARIANTS['print']
+    image = image.convert('RGB')
+    image.thumbnail(spec['size'], Image.LANCZOS)
+    buf = io.BytesIO()
+    image.save(buf, format=spec['format'], quality=spec['quality'])
+    buf.seek(0)
+    return buf
+
+
+class ReportTemplate:
+    """Diseño preparado del reporte; ``render`` solo inserta los datos de cada diagnóstico"""
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.normal = styles['Normal']
+        self.accent = colors.HexColor('#0ea5e9')
+        self.sev_colors = {sev: colors.HexColor(hex_color) for sev, hex_color in SEV_COLORS.items()}
+        self.default_sev_color = self.sev_colors[1]
+        self.grey_fill = colors.HexColor('#e5e7eb')
+        self.grey_text = colors.HexColor('#9ca3af')
+
+        def ps(name, **kw):
+            return ParagraphStyle(name, parent=self.normal, **kw)
+
+        self.white_big   = ps('WBig',  fontSize=20, fontName='Helvetica-Bold', textColor=colors.white, alignment=TA_CENTER)
+        self.white_med   = ps('WMed',  fontSize=9,  textColor=colors.white, alignment=TA_CENTER)
+        self.white_sm    = ps('WSm',   fontSize=7.5,textColor=colors.HexColor('#e5e7eb'), alignment=TA_CENTER)
+        self.sec_title   = ps('SecT',  fontSize=8,  fontName='Helvetica-Bold', textColor=self.accent, spaceBefore=8, spaceAfter=3)
+        self.lbl_style   = ps('Lbl',   fontSize=8,  fontName='Helvetica-Bold', textColor=colors.HexColor('#374151'))
+        self.val_style   = ps('Val',   fontSize=8,  textColor=colors.HexColor('#111827'))
+        self.rec_style   = ps('Rec',   fontSize=8,  textColor=colors.HexColor('#1f2937'), spaceBefore=2, spaceAfter=1, leftIndent=8)
+        self.note_style  = ps('Note',  fontSize=7,  textColor=colors.HexColor('#6b7280'))
+        self.sig_r_style = ps('SigR',  fontSize=7,  textColor=colors.HexColor('#9ca3af'), alignment=TA_RIGHT)
+        self.hdr_r_style = ps('HdrR',  alignment=TA_RIGHT, fontSize=8)
+
+        # ── Estilos de tablas ───────────────────────────────────────────
+        self.header_style = TableStyle([
+            ('VALIGN',      (0,0), (-1,-1), 'MIDDLE'),
+            ('BOTTOMPADDING',(0,0),(-1,-1), 8),
+            ('LINEBELOW',   (0,0), (-1,-1), 1, self.accent),
+        ])
+        self.hero_styles = {sev: self._hero_style(color) for sev, color in self.sev_colors.items()}
+        self.scale_styles = {sev: self._scale_style(sev) for sev in range(0, 6)}
+        self.info_style = TableStyle([
+            ('ALIGN',         (0,0), (-1,-1), 'LEFT'),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 4),
+            ('LINEBELOW',     (0,0), (-1,-1), 0.3, colors.HexColor('#e5e7eb')),
+        ])
+        self.two_col_style = TableStyle([
+            ('VALIGN',       (0,0), (-1,-1), 'TOP'),
+            ('LEFTPADDING',  (1,0), (1,-1),  12),
+        ])
+        self.images_style = TableStyle([
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+        ])
+        self.signature_style = TableStyle([
+            ('LINEABOVE',     (0,0), (0,0),   0.5, colors.HexColor('#d1d5db')),
+            ('ALIGN',         (1,0), (1,0),   'RIGHT'),
+            ('VALIGN',        (0,0), (-1,-1), 'TOP'),
+            ('TOPPADDING',    (0,0), (-1,-1), 6),
+        ])
+
+        # ── Bloques fijos ───────────────────────────────────────────────
+        self.labels = {label: Paragraph(f'<b>{label}</b>', self.lbl_style) for label in INFO_LABELS}
+        self.empty_value = Paragraph('—', self.val_style)
+        self.brand = Paragraph('<b><font color="#0ea5e9" size="13">SightTech</font></b>', self.normal)
+        self.signature_right = Paragraph('Generado por SightTech AI<br/>sighttech.mx', self.sig_r_style)
+        self.section_titles = {
+            title: Paragraph(title, self.sec_title)
+            for title in ('DATOS DEL PACIENTE', 'PARÁMETROS CLÍNICOS', 'PRÓXIMOS PASOS',
+                          'RECOMENDACIONES MÉDICAS', 'IMÁGENES DE FONDO DE OJO ANALIZADAS')
+        }
+        self.disclaimer = [
+            HRFlowable(width='100%', thickness=0.4, color=colors.HexColor('#e5e7eb')),
+            Spacer(1, 4),
+            Paragraph(
+                'Nota clínica: Este análisis es una herramienta de apoyo diagnóstico generada por IA. '
+                'El diagnóstico final y la decisión terapéutica son responsabilidad del médico tratante.',
+                self.note_style
+            ),
+        ]
+
+    def _hero_style(self, color):
+        return TableStyle([
+            ('BACKGROUND',    (0,0), (-1,-1), color),
+            ('ALIGN',         (0,0), (-1,-1), 'CENTER'),
+            ('TOPPADDING',    (0,0), (-1,-1), 10),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 10),
+        ])
+
+    def _scale_style(self, severity):
+        color = self.sev_colors.get(severity, self.default_sev_color)
+        commands = [
+            ('FONTSIZE',      (0,0), (-1,-1), 7.5),
+            ('FONTNAME',      (0,0), (-1,-1), 'Helvetica-Bold'),
+            ('ALIGN',         (0,0), (-1,-1), 'CENTER'),
+            ('TOPPADDING',    (0,0), (-1,-1), 4),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 4),
+        ]
+        for i in range(5):
+            filled = i < severity
+            commands.append(('BACKGROUND', (i,0), (i,0), color if filled else self.grey_fill))
+            commands.append(('TEXTCOLOR', (i,0), (i,0), colors.white if filled else self.grey_text))
+        return TableStyle(commands)
+
+    @staticmethod
+    def _fixed(flowable):
+        # Copia superficial: cada build guarda su propio estado de wrap/split,
+        # el texto ya parseado se comparte
+        return copy.copy(flowable)
+
+    def _value(self, value):
+        text = str(value or '—')
+        return self._fixed(self.empty_value) if text == '—' else Paragraph(text, self.val_style)
+
+    def _info_rows(self, data):
+        rows = [[self._fixed(self.labels[k]), self._value(v)] for k, v in data]
+        table = Table(rows, colWidths=[1.75*inch, 1.65*inch])
+        table.setStyle(self.info_style)
+        return table
+
+    def render(self, pdf_path, patient_data, images, diagnosis_result,
+               physician_name='SightTech', report_date=None):
+        """Genera el PDF en ``pdf_path`` y devuelve la ruta"""
+        report_date = report_date or datetime.now()
+        doc = SimpleDocTemplate(
+            pdf_path, pagesize=A4,
+            leftMargin=0.75*inch, rightMargin=0.75*inch,
+            topMargin=0.55*inch, bottomMargin=0.75*inch
+        )
+        story = []
+
+        severity   = diagnosis_result.get('severity', 1)
+        confidence = diagnosis_result.get('confidence', 0)
+        prediction = diagnosis_result.get('prediction', '—')
+        sev_label  = SEV_LABELS[severity-1] if 1 <= severity <= 5 else '—'
+
+        # ── HEADER ──────────────────────────────────────────────────────
+        hdr = Table([[
+            self._fixed(self.brand),
+            Paragraph(
+                f'<font size="8" color="#6b7280">Reporte de Análisis · Retinopatía Diabética'
+                f'<br/>Fecha: {report_date.strftime("%d/%m/%Y %H:%M")}</font>',
+                self.hdr_r_style
+            ),
+        ]], colWidths=[3.5*inch, 3.5*inch])
+        hdr.setStyle(self.header_style)
+        story.append(hdr)
+        story.append(Spacer(1, 10))
+
+        # ── DIAGNOSIS HERO ──────────────────────────────────────────────
+        hero = Table([
+            [Paragraph(sev_label, self.white_big)],
+            [Paragraph(prediction, self.white_med)],
+            [Paragraph(f'Confianza: {confidence:.1f}%   ·   Nivel: {severity}/5   ·   Imágenes analizadas: {len(images)}', self.white_sm)],
+        ], colWidths=[7*inch])
+        hero.setStyle(self.hero_styles.get(severity, self.hero_styles[1]))
+        story.append(hero)
+        story.append(Spacer(1, 5))
+
+        # ── ICDRD SCALE ─────────────────────────────────────────────────
+        scale_tbl = Table([SEV_LABELS[:]], colWidths=[1.4*inch]*5)
+        scale_tbl.setStyle(self.scale_styles.get(severity) or self._scale_style(severity))
+        story.append(scale_tbl)
+        story.append(Spacer(1, 12))
+
+        # ── TWO-COLUMN: PATIENT + CLINICAL ──────────────────────────────
+        def v(key, suffix=''):
+            val = patient_data.get(key)
+            if val in (None, '', 'No especificado'): return '—'
+            return f"{val}{suffix}"
+
+        patient_tbl = self._info_rows([
+            ('Nombre',           v('name')),
+            ('Edad',             v('age', ' años')),
+            ('Género',           v('gender')),
+            ('Años con diabetes',v('diabetes_years', ' años')),
+            ('Tipo de diabetes', v('diabetes_type','').replace('_',' ').title() if patient_data.get('diabetes_type') else '—'),
+            ('Visión OD',        v('vision_right_eye')),
+            ('Visión OI',        v('vision_left_eye')),
+            ('Medicamentos',     v('medications')),
+            ('Comorbilidades',   v('comorbidities')),
+        ])
+        clinical_tbl = self._info_rows([
+            ('Glucosa',          v('glucose_level', ' mg/dL')),
+            ('HbA1c',            v('hba1c', '%')),
+            ('Presión arterial', v('blood_pressure')),
+            ('Colesterol',       v('cholesterol', ' mg/dL')),
+            ('IMC',              v('bmi', ' kg/m²')),
+            ('Último exam. ocular', v('last_eye_exam','').replace('_',' ').title() if patient_data.get('last_eye_exam') else '—'),
+            ('Diagnóstico previo',  v('previous_diagnosis','').replace('_',' ').title() if patient_data.get('previous_diagnosis') else '—'),
+        ])
+
+        two_col = Table([
+            [self._fixed(self.section_titles['DATOS DEL PACIENTE']),
+             self._fixed(self.section_titles['PARÁMETROS CLÍNICOS'])],
+            [patient_tbl, clinical_tbl],
+        ], colWidths=[3.5*inch, 3.5*inch])
+        two_col.setStyle(self.two_col_style)
+        story.append(two_col)
+        story.append(Spacer(1, 10))
+
+        # ── NEXT STEPS ──────────────────────────────────────────────────
+        urgency_text = URGENCY.get(severity, 'Prioritaria (1-2 semanas)' if severity == 3 else 'Rutina programada')
+        steps_rows = self._info_rows([
+            ('Urgencia',            urgency_text),
+            ('Próxima revisión',    NEXT_REVIEW.get(severity, '—')),
+            ('Riesgo de progresión',PROG_RISK[severity-1] if 1 <= severity <= 5 else '—'),
+            ('Tratamiento indicado','Sí' if severity >= 3 else 'No'),
+        ])
+        story.append(self._fixed(self.section_titles['PRÓXIMOS PASOS']))
+        story.append(steps_rows)
+        story.append(Spacer(1, 10))
+
+        # ── RECOMMENDATIONS ─────────────────────────────────────────────
+        story.append(self._fixed(self.section_titles['RECOMENDACIONES MÉDICAS']))
+        for i, rec in enumerate(diagnosis_result.get('recommendations', []), 1):
+            clean = ''.join(c for c in rec if c.isascii() or 0x00C0 <= ord(c) <= 0x024F).strip()
+            story.append(Paragraph(f'{i}. {clean}', self.rec_style))
+        story.append(Spacer(1, 10))
+
+        # ── RETINAL IMAGES ──────────────────────────────────────────────
+        if images:
+            story.append(self._fixed(self.section_titles['IMÁGENES DE FONDO DE OJO ANALIZADAS']))
+            img_cells = []
+            for i, image in enumerate(images):
+                try:
+                    img_cells.append([
+                        Paragraph(f'<b>Imagen {i+1}</b>', self.lbl_style),
+                        RLImage(_print_source(image), width=2.8*inch, height=2.1*inch),
+                    ])
+                except Exception:
+                    pass
+            if img_cells:
+                img_tbl = Table(img_cells, colWidths=[0.7*inch, 3*inch])
+                img_tbl.setStyle(self.images_style)
+                story.append(img_tbl)
+            story.append(Spacer(1, 10))
+
+        # ── SIGNATURE ───────────────────────────────────────────────────
+        sig = Table([[
+            Paragraph(f'<b>{physician_name}</b><br/><font color="#6b7280" size="7.5">Médico Tratante</font>', self.normal),
+            self._fixed(self.signature_right),
+        ]], colWidths=[3.5*inch, 3.5*inch])
+        sig.setStyle(self.signature_style)
+        story.append(sig)
+        story.append(Spacer(1, 6))
+
+        # ── DISCLAIMER ──────────────────────────────────────────────────
+        story.extend(self._fixed(f) for f in self.disclaimer)
+
+        doc.build(story)
+        return pdf_path
+
+
+REPORT_TEMPLATE = ReportTemplate()
+
+
+def create_pdf_report(patient_data, images, diagnosis_result, physician_name='SightTech',
+                      pdf_path=None, report_date=None):
+    """Crea un reporte PDF médico profesional con jerarquía visual clara"""
+    if pdf_path is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+            pdf_path = tmp_file.name
+    return REPORT_TEMPLATE.render(pdf_path, patient_data, images, diagnosis_result,
+                                  physician_name, report_date)
@@ -0,0 +1,138 @@
+"""
+Caché de predicciones por contenido de imagen.
+
+La clave combina un hash de los píxeles decodificados de cada imagen con el
+identificador del modelo activo, de modo que re-subir las mismas fotos de
+fondo de ojo no vuelve a ejecutar la red. Un cambio en el archivo del modelo
+invalida la caché completa.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def image_digest(image):
+    """Hash de los píxeles decodificados (independiente del formato/metadata del archivo)"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def prediction_key(images, model_id):
+    """Clave de caché para un conjunto ordenado de imágenes y un modelo"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(model_id.encode())
+    for image in images:
+        h.update(image_digest(image).encode())
+    return h.hexdigest()
+
+
+class PredictionCache:
+    """LRU acotado en memoria con persistencia opcional en disco (un JSON por entrada)"""
+
+    def __init__(self, max_entries=512, persist_dir=None):
+        self.max_entries = max(1, int(max_entries))
+        self.persist_dir = persist_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_id = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._load_from_disk()
+
+    def _path(self, key):
+        return os.path.join(self.persist_dir, f"{key}.json")
+
+    def _model_id_path(self):
+        return os.path.join(self.persist_dir, 'model_id')
+
+    def _load_from_disk(self):
+        try:
+            with open(self._model_id_path(), encoding='utf-8') as f:
+                self._model_id = f.read().strip() or None
+        except FileNotFoundError:
+            return
+
+        files = [n for n in os.listdir(self.persist_dir) if n.endswith('.json')]
+        files.sort(key=lambda n: os.path.getmtime(os.path.join(self.persist_dir, n)))
+        for name in files[-self.max_entries:]:
+            try:
+                with open(os.path.join(self.persist_dir, name), encoding='utf-8') as f:
+                    self._entries[name[:-5]] = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def _write(self, key, value):
+        tmp_path = self._path(key) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def ensure_model(self, model_id):
+        """Vacía la caché si el modelo cambió desde la última predicción almacenada"""
+        with self._lock:
+            if model_id == self._model_id:
+                return
+            if self._model_id is not None:
+                self.invalidations += 1
+                print(f"♻️ Modelo cambiado, invalidando {len(self._entries)} predicciones en caché")
+            if self.persist_dir:
+                for key in self._entries:
+                    self._remove(key)
+                with open(self._model_id_path(), 'w', encoding='utf-8') as f:
+                    f.write(model_id)
+            self._entries.clear()
+            self._model_id = model_id
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = copy.deepcopy(value)
+            self._entries.move_to_end(key)
+            if self.persist_dir:
+                self._write(key, value)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                if self.persist_dir:
+                    self._remove(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'persistent': bool(self.persist_dir),
+                'model_id': self._model_id,
+            }
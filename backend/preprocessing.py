@@ -0,0 +1,90 @@
+"""
+Preprocesamiento rápido de fotos de fondo de ojo para el modelo.
+
+- Decodificación JPEG a escala reducida (draft de Pillow: el IDCT se hace
+  directamente a 1/2, 1/4 o 1/8) en lugar de decodificar 12 MP completos.
+- Recorte vectorizado del borde negro alrededor del círculo de la retina.
+- Normalización escrita directamente en un tensor de lote preasignado.
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from model_config import MODEL_CONFIG, PREPROCESSING_CONFIG
+
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# (x / 255 - mean) / std  ==  x * SCALE - OFFSET
+_SCALE = (1.0 / (255.0 * STD)).reshape(3, 1, 1)
+_OFFSET = (MEAN / STD).reshape(3, 1, 1)
+
+# Recorte/redimensionado en paralelo entre las imágenes de un lote (resize libera el GIL)
+_executor = ThreadPoolExecutor(
+    max_workers=PREPROCESSING_CONFIG.get('workers', 4),
+    thread_name_prefix='preprocess'
+)
+
+_RESAMPLE = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS,
+}
+
+
+def open_for_inference(source):
+    """Decodifica una imagen (bytes o ruta) a la menor escala JPEG que conserve la resolución del modelo"""
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    height, width = MODEL_CONFIG['input_size']
+    # Margen para que el recorte del borde no deje la retina por debajo de 224 px
+    margin = PREPROCESSING_CONFIG.get('draft_margin', 2)
+    image.draft('RGB', (width * margin, height * margin))
+    return image.convert('RGB')
+
+
+def crop_black_border(pixels, threshold=None):
+    """Recorta filas/columnas sin retina (máscara vectorizada sobre el canal más brillante)"""
+    threshold = PREPROCESSING_CONFIG.get('border_threshold', 10) if threshold is None else threshold
+    mask = pixels.max(axis=2) > threshold
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return pixels
+    return pixels[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
+def fill_array(image, out):
+    """Recorta, redimensiona y normaliza una imagen PIL dentro de ``out`` (float32, 3×H×W)"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    height, width = out.shape[1:]
+
+    pixels = np.asarray(image)
+    if PREPROCESSING_CONFIG.get('crop_black_border', True):
+        pixels = crop_black_border(pixels)
+
+    resample = _RESAMPLE.get(PREPROCESSING_CONFIG.get('resize_method'), Image.BILINEAR)
+    resized = np.asarray(Image.fromarray(pixels).resize((width, height), resample))
+
+    np.multiply(resized.transpose(2, 0, 1), _SCALE, out=out, casting='unsafe')
+    out -= _OFFSET
+    return out
+
+
+def preprocess_batch(images):
+    """Tensor (N, 3, H, W) listo para el modelo a partir de imágenes PIL"""
+    # torch se importa aquí para que la decodificación no lo requiera (app.py sin modelo)
+    import torch
+
+    height, width = MODEL_CONFIG['input_size']
+    batch = np.empty((len(images), 3, height, width), dtype=np.float32)
+    if len(images) == 1:
+        fill_array(images[0], batch[0])
+    else:
+        # Cada imagen escribe en su propia fila del lote: el orden no depende de los hilos
+        list(_executor.map(fill_array, images, batch))
+    return torch.from_numpy(batch)
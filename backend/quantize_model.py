@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Variante INT8 del ResNet50-APTOS y arnés de paridad FP32 vs INT8.
+
+Uso:
+    # Cuantización estática calibrada con una carpeta de fondos de ojo
+    python quantize_model.py quantize --calibration-dir datos/calibracion
+
+    # Cuantización dinámica (solo capas Linear, no requiere calibración)
+    python quantize_model.py quantize --mode dynamic
+
+    # Comparar FP32 contra INT8 antes de cambiar MODEL_CONFIG['backend'] a 'int8'
+    python quantize_model.py compare --images-dir datos/validacion --output paridad.json
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from model_config import MODEL_CONFIG
+from real_ai_model import CLASS_NAMES, load_eager_model, model_path, preprocess_images, quantized_engine
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def load_folder_tensors(folder, limit=None):
+    """Carga y preprocesa las imágenes de una carpeta en orden determinístico"""
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if limit:
+        names = names[:limit]
+    if not names:
+        raise ValueError(f"No hay imágenes en {folder}")
+
+    tensors = []
+    for name in names:
+        with Image.open(os.path.join(folder, name)) as img:
+            tensors.extend(preprocess_images([img]))
+    return names, tensors
+
+
+def _batches(tensors, batch_size):
+    for start in range(0, len(tensors), batch_size):
+        yield torch.stack(tensors[start:start + batch_size])
+
+
+def quantize_static(model, calibration_tensors, batch_size):
+    """INT8 estático (FX graph mode): pesos y activaciones cuantizados"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = quantized_engine()
+    torch.backends.quantized.engine = engine
+    example = (calibration_tensors[0].unsqueeze(0),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example)
+    with torch.no_grad():
+        for batch in _batches(calibration_tensors, batch_size):
+            prepared(batch)
+    return convert_fx(prepared), example
+
+
+def quantize_dynamic(model):
+    """INT8 dinámico: solo las capas Linear (la cabeza de clasificación)"""
+    height, width = MODEL_CONFIG['input_size']
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return quantized, (torch.zeros(1, 3, height, width),)
+
+
+def cmd_quantize(args):
+    model = load_eager_model()
+    if args.mode == 'static':
+        if not args.calibration_dir:
+            sys.exit("❌ La cuantización estática requiere --calibration-dir")
+        names, tensors = load_folder_tensors(args.calibration_dir, args.limit)
+        print(f"📊 Calibrando con {len(names)} imágenes de {args.calibration_dir}...")
+        quantized, example = quantize_static(model, tensors, args.batch_size)
+    else:
+        quantized, example = quantize_dynamic(model)
+
+    path = args.output or model_path(f"{MODEL_CONFIG['model_type']}_int8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(quantized, example).eval())
+    scripted.save(path)
+    print(f"✅ Modelo INT8 ({args.mode}) guardado en {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+def _eager_size_bytes(model):
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell()
+
+
+def _run_timed(model, tensors, batch_size):
+    probs, latencies = [], []
+    with torch.no_grad():
+        model(tensors[0].unsqueeze(0))  # calentamiento
+        for batch in _batches(tensors, batch_size):
+            started = time.perf_counter()
+            logits = model(batch)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            latencies.extend([elapsed_ms / len(batch)] * len(batch))
+            probs.append(torch.softmax(logits, dim=1).numpy())
+    return np.concatenate(probs), np.array(latencies)
+
+
+def _latency_summary(latencies):
+    return {
+        'mean_ms': round(float(latencies.mean()), 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+def compare(fp32_model, int8_model, tensors, batch_size=8):
+    """Ejecuta FP32 e INT8 lado a lado y resume latencia, acuerdo top-1 y deriva por clase"""
+    fp32_probs, fp32_lat = _run_timed(fp32_model, tensors, batch_size)
+    int8_probs, int8_lat = _run_timed(int8_model, tensors, batch_size)
+
+    fp32_top1 = fp32_probs.argmax(axis=1)
+    int8_top1 = int8_probs.argmax(axis=1)
+    drift = np.abs(fp32_probs - int8_probs)
+
+    return {
+        'images': len(tensors),
+        'batch_size': batch_size,
+        'latency_per_image': {'fp32': _latency_summary(fp32_lat), 'int8': _latency_summary(int8_lat)},
+        'speedup': round(float(fp32_lat.mean() / int8_lat.mean()), 2),
+        'top1_agreement': round(float((fp32_top1 == int8_top1).mean()), 4),
+        'severity_disagreements': [
+            {'index': int(i), 'fp32_severity': int(fp32_top1[i]) + 1, 'int8_severity': int(int8_top1[i]) + 1}
+            for i in np.nonzero(fp32_top1 != int8_top1)[0]
+        ],
+        'probability_drift': {
+            name: {'mean_abs': round(float(drift[:, c].mean()), 5), 'max_abs': round(float(drift[:, c].max()), 5)}
+            for c, name in enumerate(CLASS_NAMES)
+        },
+    }
+
+
+def cmd_compare(args):
+    int8_path = args.int8_path or model_path(f"{MODEL_CONFIG['model_type']}_int8")
+    torch.backends.quantized.engine = quantized_engine()
+
+    fp32_model = load_eager_model()
+    int8_model = torch.jit.load(int8_path, map_location='cpu').eval()
+    names, tensors = load_folder_tensors(args.images_dir, args.limit)
+
+    report = compare(fp32_model, int8_model, tensors, args.batch_size)
+    report['model_size_mb'] = {
+        'fp32': round(_eager_size_bytes(fp32_model) / 1e6, 2),
+        'int8': round(os.path.getsize(int8_path) / 1e6, 2),
+    }
+    for item in report['severity_disagreements']:
+        item['image'] = names[item['index']]
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if report['top1_agreement'] < args.min_agreement:
+        print(f"❌ Acuerdo top-1 {report['top1_agreement']:.2%} por debajo de {args.min_agreement:.2%}")
+        sys.exit(1)
+    print(f"✅ Acuerdo top-1 {report['top1_agreement']:.2%} — speedup x{report['speedup']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cuantización INT8 del ResNet50-APTOS')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    q = sub.add_parser('quantize', help='Generar el modelo INT8')
+    q.add_argument('--mode', choices=['static', 'dynamic'], default='static')
+    q.add_argument('--calibration-dir', help='Carpeta con imágenes de fondo de ojo para calibrar')
+    q.add_argument('--limit', type=int, default=200, help='Máximo de imágenes de calibración')
+    q.add_argument('--batch-size', type=int, default=8)
+    q.add_argument('--output', help='Ruta de salida (por defecto MODEL_PATHS)')
+    q.set_defaults(func=cmd_quantize)
+
+    c = sub.add_parser('compare', help='Arnés de paridad FP32 vs INT8')
+    c.add_argument('--images-dir', required=True, help='Carpeta con imágenes de evaluación')
+    c.add_argument('--int8-path', help='Modelo INT8 a evaluar (por defecto MODEL_PATHS)')
+    c.add_argument('--limit', type=int, default=None)
+    c.add_argument('--batch-size', type=int, default=8)
+    c.add_argument('--min-agreement', type=float, default=0.98, help='Acuerdo top-1 mínimo aceptable')
+    c.add_argument('--output', help='Guardar el reporte JSON')
+    c.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,26 @@ ResNet50 entrenado en APTOS 2019 — HuggingFace: sakshamkr1/ResNet50-APTOS-DR
 Licencia: CC-BY-NC 4.0 (uso académico/no comercial)
 """
 
+import multiprocessing
 import os
+import threading
 import numpy as np
 from PIL import Image
 import torch
-import torchvision.transforms as transforms
 from huggingface_hub import hf_hub_download
 
+from model_config import MODEL_CONFIG, MODEL_PATHS, POOL_CONFIG, SCHEDULER_CONFIG
+from inference_pool import InferencePool, restart_forkserver
+from inference_scheduler import InferenceScheduler
+from preprocessing import preprocess_batch
+
 MODEL_REPO  = "sakshamkr1/ResNet50-APTOS-DR"
 MODEL_FILE  = "diabetic_retinopathy_full_model.pth"
 MODEL_CACHE = os.path.join(os.path.dirname(__file__), MODEL_FILE)
 
+# Backends de inferencia soportados en MODEL_CONFIG['backend']
+BACKENDS = ('torch', 'torchscript', 'onnx', 'int8')
+
 CLASS_NAMES = [
     "Sin retinopatía diabética",
     "Retinopatía diabética leve (NPDR)",
@@ -22,21 +31,23 @@ CLASS_NAMES = [
     "Retinopatía diabética proliferativa (PDR)"
 ]
 
-TRANSFORM = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225])
-])
-
 _model = None
+_model_id = None  # model_identifier() del archivo con el que se cargó _model
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_model_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
 
 
-def _load_model():
-    global _model
-    if _model is not None:
-        return _model
+def model_path(key):
+    """Ruta absoluta de un artefacto declarado en MODEL_PATHS"""
+    path = MODEL_PATHS[key]
+    return path if os.path.isabs(path) else os.path.join(os.path.dirname(__file__), path)
 
+
+def download_model():
+    """Descarga el ResNet50 de HuggingFace si aún no está en disco"""
     if not os.path.exists(MODEL_CACHE):
         print(f"⬇️  Descargando modelo desde HuggingFace ({MODEL_REPO})...")
         hf_hub_download(
@@ -46,28 +57,258 @@ def _load_model():
         )
         print("✅ Modelo descargado correctamente")
 
+
+def load_eager_model():
+    """Descarga (si hace falta) y carga el ResNet50 completo en PyTorch eager"""
+    download_model()
+
     print("🔄 Cargando ResNet50-APTOS en memoria...")
-    _model = torch.load(MODEL_CACHE, map_location=torch.device('cpu'), weights_only=False)
-    _model.eval()
-    print("✅ Modelo listo para predicción")
-    return _model
+    model = torch.load(MODEL_CACHE, map_location=torch.device('cpu'), weights_only=False)
+    model.eval()
+    return model
 
 
-def predict_retinopathy_with_real_ai(images):
-    """Predicción con ResNet50 entrenado en APTOS 2019 (5 clases ICDRD)"""
-    model = _load_model()
+class _OnnxModel:
+    """Adaptador de ONNX Runtime con la misma interfaz que el módulo de torch"""
+
+    def __init__(self, path):
+        self.path = path
+        self._create_session()
+
+    def _create_session(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self._pid = os.getpid()
+
+    def __call__(self, batch):
+        # Los hilos de ONNX Runtime no sobreviven a un fork: cada worker del pool crea su sesión
+        if os.getpid() != self._pid:
+            self._create_session()
+        logits = self.session.run(None, {self.input_name: batch.numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def quantized_engine():
+    """Motor de kernels INT8 disponible en esta CPU (x86 > fbgemm > qnnpack)"""
+    supported = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in supported:
+            return engine
+    raise RuntimeError("PyTorch sin soporte de cuantización en esta plataforma")
+
+
+def _ensure_model_file(backend):
+    """El archivo de pesos del backend existe (el de torch se descarga si falta)"""
+    if backend == 'torch':
+        download_model()
+        return
+    path = model_path(f"{MODEL_CONFIG['model_type']}_{backend}")
+    if not os.path.exists(path):
+        command = 'quantize_model.py quantize' if backend == 'int8' else f'export_model.py --format {backend}'
+        raise FileNotFoundError(f"{path} no existe — generarlo con: python {command}")
+
+
+def _load_backend_model(backend):
+    if backend == 'torch':
+        return load_eager_model()
+
+    _ensure_model_file(backend)
+    key = f"{MODEL_CONFIG['model_type']}_{backend}"
+    path = model_path(key)
+
+    print(f"🔄 Cargando {key} desde {path}...")
+    if backend == 'int8':
+        # Mismo motor de kernels cuantizados que se usó al calibrar (quantize_model.py)
+        torch.backends.quantized.engine = quantized_engine()
+        return torch.jit.load(path, map_location='cpu').eval()
+    if backend == 'torchscript':
+        # optimize_for_inference se aplica al cargar: el grafo resultante no es serializable
+        return torch.jit.optimize_for_inference(torch.jit.load(path, map_location='cpu').eval())
+    return _OnnxModel(path)
+
+
+def active_model_path():
+    """Archivo de pesos que usa el backend configurado"""
+    backend = MODEL_CONFIG.get('backend', 'torch')
+    if backend == 'torch':
+        return MODEL_CACHE
+    return model_path(f"{MODEL_CONFIG['model_type']}_{backend}")
+
+
+def model_identifier():
+    """Identificador del modelo activo (cambia si se reemplaza el archivo); None si aún no existe"""
+    path = active_model_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{MODEL_CONFIG.get('backend', 'torch')}:{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _load_model(model_id=None):
+    """Modelo en memoria; con ``model_id`` lo recarga si el cargado proviene de otro archivo"""
+    global _model, _model_id
+    if _model is not None and model_id in (None, _model_id):
+        return _model
+
+    with _model_lock:
+        if _model is not None and model_id in (None, _model_id):
+            return _model
+
+        backend = MODEL_CONFIG.get('backend', 'torch')
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de inferencia desconocido: {backend}")
+        if _model is not None:
+            print(f"♻️ Recargando el modelo ({_model_id} → {model_id})")
+        # Id tomado antes de leer los pesos: si el archivo cambia durante la carga, se recarga otra vez
+        _ensure_model_file(backend)
+        loaded_id = model_identifier()
+        _model, _model_id = _load_backend_model(backend), loaded_id
+        print(f"✅ Modelo listo para predicción (backend: {backend})")
+        return _model
 
-    individual_results = []
-    for i, img in enumerate(images):
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
 
-        tensor = TRANSFORM(img).unsqueeze(0)
+def _infer_probabilities(model, batch):
+    """Forward + softmax de un lote; se ejecuta en este proceso o en un worker del pool"""
+    with torch.no_grad():
+        outputs = model(torch.as_tensor(batch))
+        return torch.softmax(outputs, dim=1).cpu().numpy()
 
-        with torch.no_grad():
-            outputs = model(tensor)
-            probs = torch.softmax(outputs, dim=1)[0].cpu().numpy()
 
+def _pool_enabled():
+    # El pool comparte los pesos vía forkserver; sin él (Windows) se infiere en el proceso
+    return POOL_CONFIG.get('enabled') and 'forkserver' in multiprocessing.get_all_start_methods()
+
+
+def _get_pool():
+    """Pool de inferencia para el archivo de pesos actual; si el archivo cambió, lo reemplaza"""
+    global _pool
+    model_id = model_identifier()
+    if _pool is not None and model_id in (None, _pool.model_id):
+        return _pool
+
+    with _pool_lock:
+        _ensure_model_file(MODEL_CONFIG.get('backend', 'torch'))
+        model_id = model_identifier()
+        if _pool is not None and _pool.model_id == model_id:
+            return _pool
+
+        if _pool is not None:
+            # Los lotes ya encolados terminan antes de cerrarlo. El forkserver tiene precargados
+            # los pesos anteriores: se reinicia para que los workers nuevos compartan los nuevos
+            # en vez de cargar cada uno su propia copia
+            print(f"♻️ Archivo del modelo cambiado: reiniciando pool de inferencia y forkserver ({model_id})")
+            _pool.close()
+            restart_forkserver()
+
+        # El modelo se carga en el forkserver (inference_preload), no en el proceso web
+        _pool = InferencePool(
+            _load_model, _infer_probabilities,
+            model_id=model_id,
+            preload=['inference_preload'],
+            workers=POOL_CONFIG['workers'],
+            threads_per_worker=POOL_CONFIG['threads_per_worker'],
+            health_check_seconds=POOL_CONFIG['health_check_seconds'],
+            max_retries=POOL_CONFIG['max_retries'],
+            task_timeout=POOL_CONFIG.get('task_timeout_seconds', 120)
+        )
+        return _pool
+
+
+def current_model_id():
+    """Identificador del modelo con el que se predice. Si el archivo de pesos cambió desde
+    que se cargó, primero recarga el modelo (o reinicia el pool): la caché de predicciones
+    nunca guarda resultados de los pesos anteriores bajo el identificador nuevo"""
+    if _pool_enabled():
+        return _get_pool().model_id
+    _load_model(model_identifier())
+    return _model_id
+
+
+def _run_batch(batch):
+    if _pool_enabled():
+        return _get_pool().run(batch.numpy())
+    return _infer_probabilities(_load_model(), batch)
+
+
+def warmup_model(passes=None):
+    """Carga el modelo y ejecuta forward passes sobre tensores vacíos de 224×224"""
+    passes = MODEL_CONFIG.get('warmup_passes', 2) if passes is None else passes
+    height, width = MODEL_CONFIG['input_size']
+    # Calentar tanto el caso de una imagen como el de un lote completo
+    batch_sizes = sorted({1, max(1, int(MODEL_CONFIG.get('batch_size', 1)))})
+    for _ in range(passes):
+        for batch_size in batch_sizes:
+            batch = torch.zeros(batch_size, 3, height, width)
+            if _pool_enabled():
+                _get_pool().broadcast(batch.numpy())
+            else:
+                _infer_probabilities(_load_model(), batch)
+    print(f"🔥 Modelo calentado ({passes} pasadas, lotes {batch_sizes})")
+
+
+def _predict_probabilities(tensors):
+    """Ejecuta el modelo en lotes de MODEL_CONFIG['batch_size'] y devuelve las probabilidades"""
+    batch_size = max(1, int(MODEL_CONFIG.get('batch_size', 1)))
+    probs = []
+    for start in range(0, len(tensors), batch_size):
+        probs.extend(_run_batch(tensors[start:start + batch_size]))
+    return probs
+
+
+def _forward_batch(tensors):
+    """Forward pass único sobre un lote ya agrupado por el planificador"""
+    return list(_run_batch(torch.stack(tensors)))
+
+
+def _get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(
+                    _forward_batch,
+                    max_batch_size=SCHEDULER_CONFIG['max_batch_size'],
+                    max_wait_ms=SCHEDULER_CONFIG['max_wait_ms'],
+                    # Con pool, un lote en vuelo por proceso
+                    concurrency=_get_pool().size if _pool_enabled() else 1
+                )
+    return _scheduler
+
+
+def get_scheduler_stats():
+    """Estadísticas del planificador de micro-batching (None si no se ha usado)"""
+    return _scheduler.stats() if _scheduler is not None else None
+
+
+def get_pool_stats():
+    """Estadísticas del pool de procesos de inferencia (None si no está activo)"""
+    return _pool.stats() if _pool is not None else None
+
+
+def preprocess_images(images):
+    """Convierte imágenes PIL en un lote (N, 3, H, W) normalizado de entrada al modelo"""
+    return preprocess_batch(images)
+
+
+def predict_retinopathy_with_real_ai(images):
+    """Predicción con ResNet50 entrenado en APTOS 2019 (5 clases ICDRD)"""
+    if not _pool_enabled():
+        _load_model(model_identifier())  # Recarga si el archivo de pesos cambió
+    tensors = preprocess_images(images)
+
+    if SCHEDULER_CONFIG.get('enabled'):
+        all_probs = _get_scheduler().submit(list(tensors))
+    else:
+        all_probs = _predict_probabilities(tensors)
+
+    individual_results = []
+    for i, probs in enumerate(all_probs):
         class_idx = int(np.argmax(probs))
         confidence = float(probs[class_idx] * 100)
 
@@ -0,0 +1,102 @@
+"""
+Caché de reportes PDF por diagnóstico.
+
+Los PDF se generan fuera de la petición de análisis (en segundo plano o en la
+primera descarga) y se guardan en ``reports/<bloque>/diagnostico_<id>_v<N>.pdf``.
+Un candado por clave (hilos) más un candado de archivo (procesos) evitan que
+dos peticiones concurrentes rendericen el mismo reporte; la escritura es
+atómica (archivo temporal + ``os.replace``). Los candados de archivo son un
+conjunto fijo en ``reports/.locks`` (la ruta se reparte por hash), así que no
+se acumula un archivo por reporte ni hace falta borrarlos.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+
+from pdf_report import create_pdf_report
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo candado entre hilos
+    fcntl = None
+
+REPORTS_ROOT = os.environ.get('REPORTS_DIR', 'reports')
+
+# Subir al cambiar el diseño del reporte: invalida los PDF ya cacheados
+REPORT_VERSION = 1
+
+# Archivos de candado entre procesos; dos reportes que caen en el mismo solo se turnan
+LOCK_STRIPES = 64
+
+# Un candado por ruta mientras alguien lo use (se liberan solos)
+_locks = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+
+def report_path(diagnosis_id, root=None):
+    """Ruta durable del PDF de un diagnóstico (1000 reportes por carpeta)"""
+    root = root or REPORTS_ROOT
+    return os.path.join(root, f'{diagnosis_id // 1000:04d}',
+                        f'diagnostico_{diagnosis_id}_v{REPORT_VERSION}.pdf')
+
+
+def _key_lock(path):
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = threading.Lock()
+        return lock
+
+
+def _lock_file_path(path):
+    stripe = int(hashlib.sha1(os.path.abspath(path).encode()).hexdigest(), 16) % LOCK_STRIPES
+    return os.path.join(REPORTS_ROOT, '.locks', f'{stripe:02d}.lock')
+
+
+def ensure_report(path, render):
+    """Devuelve ``path``; si no existe llama a ``render(ruta_temporal)`` una sola vez"""
+    if os.path.exists(path):
+        return path
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    lock_path = _lock_file_path(path)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    with _key_lock(path):
+        with open(lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Otro hilo o proceso pudo terminarlo mientras esperábamos
+                if os.path.exists(path):
+                    return path
+
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+                os.close(fd)
+                try:
+                    render(tmp_path)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                return path
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def render_report(path, patient_data, images, diagnosis_result, physician_name='SightTech',
+                  report_date=None):
+    """Renderiza el PDF en ``path`` si falta; solo recibe datos planos, así que puede correr
+    en otro proceso (exportación masiva)"""
+    def render(tmp_path):
+        create_pdf_report(patient_data, images, diagnosis_result, physician_name,
+                          pdf_path=tmp_path, report_date=report_date)
+
+    return ensure_report(path, render)
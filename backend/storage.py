@@ -0,0 +1,75 @@
+"""
+Almacenamiento direccionado por contenido para las imágenes subidas.
+
+Cada archivo se guarda con sus bytes originales (sin re-codificar) en
+``uploads/<ab>/<cd>/<sha256>.<ext>``: el hash se calcula mientras se copia el
+stream a disco, las imágenes idénticas se deduplican y la extensión se deduce
+del contenido, no del nombre que envió el cliente.
+"""
+
+import hashlib
+import os
+import tempfile
+
+UPLOAD_ROOT = os.environ.get('UPLOAD_DIR', 'uploads')
+CHUNK_SIZE = 1024 * 1024
+
+# Firmas de los formatos de imagen aceptados
+_MAGIC = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+    (b'BM', '.bmp'),
+    (b'GIF8', '.gif'),
+)
+
+
+def _extension(head):
+    for magic, ext in _MAGIC:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return '.bin'
+
+
+def blob_path(digest, ext, root=None):
+    """Ruta del blob: dos niveles de subdirectorios para no saturar una sola carpeta"""
+    root = root or UPLOAD_ROOT
+    return os.path.join(root, digest[:2], digest[2:4], digest + ext)
+
+
+def store_upload(stream, root=None):
+    """Copia el stream a disco calculando su SHA-256; devuelve (ruta, digest, creado)"""
+    root = root or UPLOAD_ROOT
+    tmp_dir = os.path.join(root, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    sha = hashlib.sha256()
+    head = b''
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                sha.update(chunk)
+                out.write(chunk)
+
+        digest = sha.hexdigest()
+        path = blob_path(digest, _extension(head), root)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return path, digest, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path, digest, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,104 @@
+"""
+Pruebas de número de consultas SQL: /api/patients y /api/dashboard deben
+ejecutar la misma cantidad de sentencias sin importar cuántos pacientes haya
+"""
+
+import os
+from contextlib import contextmanager
+
+# BD en memoria: nunca tocar instance/sighttech.db
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from sqlalchemy import event
+
+from app import app, db, diagnosis_detail_rows, insert_detail_rows, Patient, Diagnosis
+
+
+def seed(patients, diagnoses_per_patient=3):
+    """Reinicia la BD con pacientes y diagnósticos sintéticos"""
+    db.drop_all()
+    db.create_all()
+    for i in range(patients):
+        patient = Patient(name=f'Paciente {i}', age=40 + i % 40, gender='Femenino')
+        db.session.add(patient)
+        db.session.flush()
+        for j in range(diagnoses_per_patient):
+            db.session.add(Diagnosis(patient_id=patient.id, prediction='Sin retinopatía diabética',
+                                     confidence=90.0, severity=1 + j % 5))
+    db.session.commit()
+    db.session.remove()
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def statements_for(url, patients):
+    with app.app_context():
+        seed(patients)
+        client = app.test_client()
+        with count_statements() as statements:
+            response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        return len(statements), response.get_json()
+
+
+def test_patients_constant_queries():
+    """/api/patients: una consulta agregada, sin cargar diagnósticos por paciente"""
+    print("🧪 Contando consultas de /api/patients...")
+    few, _ = statements_for('/api/patients', 3)
+    many, body = statements_for('/api/patients', 40)
+    print(f"📊 3 pacientes: {few} consultas · 40 pacientes: {many} consultas")
+    assert few == many == 1
+    assert len(body) == 40
+    assert all(p['diagnoses_count'] == 3 for p in body)
+
+
+def test_dashboard_constant_queries():
+    """/api/dashboard: los diagnósticos recientes traen a su paciente con un JOIN"""
+    print("🧪 Contando consultas de /api/dashboard...")
+    few, _ = statements_for('/api/dashboard', 3)
+    many, body = statements_for('/api/dashboard', 40)
+    print(f"📊 3 pacientes: {few} consultas · 40 pacientes: {many} consultas")
+    assert few == many
+    assert len(body['recent_diagnoses']) == 10
+    assert all(d['patient_name'].startswith('Paciente') for d in body['recent_diagnoses'])
+
+
+def test_diagnosis_filters():
+    """/api/diagnoses: síntomas y severidad se filtran en la BD con las tablas normalizadas"""
+    print("🧪 Filtrando diagnósticos por síntoma y severidad...")
+    with app.app_context():
+        seed(10)
+        for diagnosis in Diagnosis.query:
+            symptoms = ['perdida_vision'] if diagnosis.id % 2 else ['vision_borrosa']
+            insert_detail_rows(diagnosis_detail_rows(diagnosis.id, {'symptoms': symptoms}, {}, [], []))
+        db.session.commit()
+        expected = sorted(d.id for d in Diagnosis.query if d.id % 2 and d.severity == 2)
+
+        client = app.test_client()
+        with count_statements() as statements:
+            response = client.get('/api/diagnoses?symptom=perdida_vision&severity=2')
+        assert response.status_code == 200, response.get_json()
+        assert len(statements) == 1
+        assert sorted(d['id'] for d in response.get_json()) == expected
+        count = client.get('/api/diagnoses/count?symptom=perdida_vision&severity=2').get_json()
+        print(f"📊 {count['count']} diagnósticos en la cohorte")
+        assert count == {'count': len(expected), 'by_severity': {'2': len(expected)}}
+
+
+if __name__ == "__main__":
+    test_patients_constant_queries()
+    test_dashboard_constant_queries()
+    test_diagnosis_filters()
+    print("\n🎉 ¡Todas las pruebas exitosas!")
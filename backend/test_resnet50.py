@@ -1,37 +1,58 @@
 """
-Script para probar el modelo ResNet50
+Script para probar el modelo ResNet50 (python test_resnet50.py)
+
+Las pruebas no empiezan por ``test_`` a propósito: descargan los pesos y
+arrancan el pool de inferencia, así que pytest no las recoge.
 """
 
 import numpy as np
 from PIL import Image
 import os
 
-def create_test_image():
-    """Crear una imagen de prueba"""
-    # Crear una imagen sintética de 224x224 píxeles
-    img_array = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
-    img = Image.fromarray(img_array)
-    return img
+def create_test_image(size=(224, 224), fundus=False, seed=None):
+    """Crear una imagen de prueba (ruido, o fondo de ojo sintético si fundus=True)"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    if not fundus:
+        # Crear una imagen sintética de ruido del tamaño pedido
+        img_array = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        return Image.fromarray(img_array)
+
+    # Disco de retina anaranjado sobre fondo negro, como una cámara de fondo de ojo
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx, cy, radius = width / 2, height / 2, min(width, height) * 0.48
+    dist = np.sqrt((xx - cx) ** 2 + (yy - cy) ** 2) / radius
+    inside = dist <= 1.0
+
+    shade = np.clip(1.0 - 0.6 * dist ** 2, 0, 1)
+    img_array = np.zeros((height, width, 3), dtype=np.float32)
+    img_array[..., 0] = 200 * shade
+    img_array[..., 1] = 90 * shade
+    img_array[..., 2] = 40 * shade
 
-def test_resnet50_model():
+    # Disco óptico brillante desplazado del centro
+    optic = np.sqrt((xx - cx - radius * 0.35) ** 2 + (yy - cy) ** 2) < radius * 0.12
+    img_array[optic] = (250, 220, 170)
+
+    img_array += rng.normal(0, 6, img_array.shape)
+    img_array[~inside] = 0
+    return Image.fromarray(np.clip(img_array, 0, 255).astype(np.uint8))
+
+def run_resnet50_smoke():
     """Probar el modelo ResNet50"""
     print("🧪 Probando modelo ResNet50...")
     
     try:
         # Importar el modelo
-        from real_ai_model import RetinopathyResNet50Model
-        
-        # Crear instancia del modelo
-        print("🔄 Inicializando modelo ResNet50...")
-        model = RetinopathyResNet50Model()
+        from real_ai_model import predict_retinopathy_with_real_ai
         
         # Crear imágenes de prueba
         print("🔄 Creando imágenes de prueba...")
-        test_images = [create_test_image() for _ in range(3)]
+        test_images = [create_test_image((1024, 768), fundus=True, seed=i) for i in range(3)]
         
         # Realizar predicción
         print("🔄 Realizando predicción...")
-        result = model.predict_multiple_images(test_images)
+        result = predict_retinopathy_with_real_ai(test_images)
         
         if result:
             print("✅ Predicción exitosa!")
@@ -53,7 +74,7 @@ def test_resnet50_model():
         print(f"❌ Error probando modelo: {e}")
         return False
 
-def test_model_integration():
+def run_model_integration_smoke():
     """Probar la integración con el sistema principal"""
     print("\n🔗 Probando integración con sistema principal...")
     
@@ -83,10 +104,10 @@ if __name__ == "__main__":
     print("🚀 Iniciando pruebas del modelo ResNet50...")
     
     # Probar modelo directamente
-    success1 = test_resnet50_model()
+    success1 = run_resnet50_smoke()
     
     # Probar integración
-    success2 = test_model_integration()
+    success2 = run_model_integration_smoke()
     
     if success1 and success2:
         print("\n🎉 ¡Todas las pruebas exitosas!")